@@ -1,7 +1,23 @@
 import argparse
+import binascii
+import collections
+import concurrent.futures
+try:
+  import fcntl
+except ImportError:  # not on Windows
+  fcntl = None
 import hashlib
+import io
+import itertools
+import json
+import mmap
 import os
+import re
+import shutil
+import struct
 import sys
+import wave
+import zipfile
 
 
 #TODO stop access to INT 13 so other software can't access the disk?
@@ -13,286 +29,853 @@ CASSBOX_ASM = (
   # Initialization
   
   '0100 FA                 CLI                      ', # Interrupts off while we set up the stack
-  '0101 B8 C0 87           MOV  AX,87C0             ', # Set up stack to have all of seg 0x87C0, which will keep it out of our way
+  '0101 B8 00 80           MOV  AX,8000             ', # Set up stack to have all of seg 0x8000, which will keep it out of our way
   '0104 8E D0              MOV  SS,AX               ', #  "
   '0106 31 E4              XOR  SP,SP               ', #  "
   '0108 FB                 STI                      ', # Safe to reenable interrupts now
-  '0109 B8 C0 97           MOV  AX,97C0             ', # Set up ES to point to high RAM
+  '0109 B8 00 90           MOV  AX,9000             ', # Set up ES to point to high RAM
   '010C 8E C0              MOV  ES,AX               ', #  "
-  '010E 31 C9              XOR  CX,CX               ', # Load MBR into high RAM
-  '0110 E8 48 00           CALL 015B                ', #  "
+  '010E B9 01 00           MOV  CX,0001             ', # Load CassBox (MBR and the three sectors following it, which are at the
+  '0111 31 D2              XOR  DX,DX               ', #  start of track 0 whatever the diskette's geometry) into high RAM
   '0113 31 DB              XOR  BX,BX               ', #  "
-  '0115 B8 01 02           MOV  AX,0201             ', #  "
+  '0115 B8 04 02           MOV  AX,0204             ', #  "
   '0118 CD 13              INT  13                  ', #  "
-  '011A B9 01 00           MOV  CX,0001             ', # Skip a sector, then load BASIC into RAM
-  '011D E8 3B 00           CALL 015B                ', #  "
-  '0120 BB 00 04           MOV  BX,0400             ', #  "
-  '0123 B8 40 02           MOV  AX,0240             ', #  "
-  '0126 CD 13              INT  13                  ', #  "
-  '0128 31 C0              XOR  AX,AX               ', # Point data segment to interrupt vector table
-  '012A 8E D8              MOV  DS,AX               ', #  "
-  '012C 26                 ES:                      ', # Zero out tape counter
-  '012D A3 00 00           MOV  [0000],AX           ', #  "
-  '0130 26                 ES:                      ', #  "
-  '0131 A3 02 00           MOV  [0002],AX           ', #  "
-  '0134 FA                 CLI                      ', # Interrupts off while we modify vector table
-  '0135 8C C0              MOV  AX,ES               ', # Set up the interrupt vector for our INT 12 handler (return memory size)
-  '0137 C7 06 48 00 4F 00  MOV  WORD PTR [0048],004F', #  "
-  '013D A3 4A 00           MOV  [004A],AX           ', #  "
-  '0140 C7 06 54 00 EA 00  MOV  WORD PTR [0054],00EA', # Set up the interrupt vector for our INT 15 handler (cassette operations)
-  '0146 A3 56 00           MOV  [0056],AX           ', #  "
-  '0149 FB                 STI                      ', # Safe to reenable interrupts now
-  '014A EA 00 00 00 98     JMP  9800:0000           ', # Jump into BASIC
+  '011A 8C C0              MOV  AX,ES               ', # Point DS to CassBox in high RAM so we can find the diskette's geometry
+  '011C 8E D8              MOV  DS,AX               ', #  "
+  '011E B9 04 00           MOV  CX,0004             ', # Skip CassBox's sectors, then load BASIC into RAM
+  '0121 E8 7B 00           CALL 019F                ', #  "
+  '0124 BB 00 80           MOV  BX,8000             ', #  "
+  '0127 B8 40 02           MOV  AX,0240             ', #  "
+  '012A CD 13              INT  13                  ', #  "
+  '012C B9 44 00           MOV  CX,0044             ', # Load the tape directory, which follows BASIC, into high RAM
+  '012F E8 6D 00           CALL 019F                ', #  "
+  '0132 BB 00 0A           MOV  BX,0A00             ', #  "
+  '0135 B8 01 02           MOV  AX,0201             ', #  "
+  '0138 CD 13              INT  13                  ', #  "
+  '013A 31 DB              XOR  BX,BX               ', # Build CRC lookup table in high RAM: high bytes of the CRC of each byte
+  '013C 88 DE              MOV  DH,BL               ', #  value at 0800, low bytes at 0900
+  '013E 30 D2              XOR  DL,DL               ', #  "
+  '0140 B9 08 00           MOV  CX,0008             ', #  "
+  '0143 D1 E2              SHL  DX,1                ', #  "
+  '0145 73 04              JNB  014B                ', #  "
+  '0147 81 F2 21 10        XOR  DX,1021             ', #  "
+  '014B E2 F6              LOOP 0143                ', #  "
+  '014D 88 B7 00 08        MOV  [BX+0800],DH        ', #  "
+  '0151 88 97 00 09        MOV  [BX+0900],DL        ', #  "
+  '0155 FE C3              INC  BL                  ', #  "
+  '0157 75 E3              JNZ  013C                ', #  "
+  '0159 31 C0              XOR  AX,AX               ', # Point data segment to interrupt vector table
+  '015B 8E D8              MOV  DS,AX               ', #  "
+  '015D 26                 ES:                      ', # Zero out tape counter
+  '015E A3 00 00           MOV  [0000],AX           ', #  "
+  '0161 26                 ES:                      ', #  "
+  '0162 A3 02 00           MOV  [0002],AX           ', #  "
+  '0165 48                 DEC  AX                  ', # Mark track buffer as empty and unchanged
+  '0166 26                 ES:                      ', #  "
+  '0167 A3 04 00           MOV  [0004],AX           ', #  "
+  '016A 26                 ES:                      ', #  "
+  '016B C7 06 0A 00 FF 00  MOV  WORD PTR [000A],00FF', #  "
+  '0171 26                 ES:                      ', # Ask for the first tape, if this is a tape library, to be selected on the
+  '0172 C7 06 0C 00 00 01  MOV  WORD PTR [000C],0100', #  first cassette operation
+  '0178 26                 ES:                      ', # Start with the cassette right after the tape directory until then
+  '0179 C7 06 0E 00 45 00  MOV  WORD PTR [000E],0045', #  "
+  '017F FA                 CLI                      ', # Interrupts off while we modify vector table
+  '0180 8C C0              MOV  AX,ES               ', # Set up the interrupt vector for our INT 12 handler (return memory size)
+  '0182 C7 06 48 00 9A 00  MOV  WORD PTR [0048],009A', #  "
+  '0188 A3 4A 00           MOV  [004A],AX           ', #  "
+  '018B C7 06 54 00 00 02  MOV  WORD PTR [0054],0200', # Set up the interrupt vector for our INT 15 handler (cassette operations)
+  '0191 A3 56 00           MOV  [0056],AX           ', #  "
+  '0194 FB                 STI                      ', # Safe to reenable interrupts now
+  '0195 EA 00 00 00 98     JMP  9800:0000           ', # Jump into BASIC
   
   # Interrupt handler for INT 12 (get memory size in KB)
   
-  '014F FB                 STI                      ', # Reenable interrupts
-  '0150 B8 5F 02           MOV  AX,025F             ', # Lie and say memory size is only 607 KB
-  '0153 CF                 IRET                     ', #  "
+  '019A FB                 STI                      ', # Reenable interrupts
+  '019B B8 40 02           MOV  AX,0240             ', # Lie and say memory size is only 576 KB
+  '019E CF                 IRET                     ', #  "
   
-  # Subprogram: set up registers for an INT 13 call on a 320 KB (DS, DD, 8 sec/tk) diskette
-  # Pre: when entered at 015B, CX contains the linear block number; when entered at 0154, cassette block number is used instead
+  # Subprogram: set up registers for an INT 13 call on a diskette of the geometry given at the end of the MBR
+  # Pre: CX contains the linear block number, DS points to CassBox in high RAM
   # Post: CX and DX set up with parameters for an INT 13 call, AX trashed
   
-  '0154 8B 0E 02 00        MOV  CX,[0002]           ', # Load cassette block number for conversion
-  '0158 83 C1 41           ADD  CX,+41              ', # Offset by 65 blocks to include BASIC and CassBox before conversion
-  '015B 81 F9 80 02        CMP  CX,0280             ', # If block is out of bounds, raise carry and return to caller
-  '015F 7D 18              JGE  0179                ', #  "
-  '0161 89 C8              MOV  AX,CX               ', # Copy block number into AX and DX
-  '0163 89 CA              MOV  DX,CX               ', #  "
-  '0165 B1 04              MOV  CL,04               ', # Dump the bottom three bits (sector number) off AX and move the fourth into
-  '0167 D3 E8              SHR  AX,CL               ', #  LSB of DH (head number); we will mask off other bits later
-  '0169 D0 D6              RCL  DH,1                ', #  "
-  '016B 88 D1              MOV  CL,DL               ', # Copy the bottom three bits of block number (sector number) into CL and
-  '016D 80 E1 07           AND  CL,07               ', #  increment because sectors are 1-based
-  '0170 FE C1              INC  CL                  ', #  "
-  '0172 81 E2 00 01        AND  DX,0100             ', # Set DL (drive number) to 0, mask extra bits off head number, clear carry
-  '0176 88 C5              MOV  CH,AL               ', # Move bits 11-4 of block into CH (track num), tho' only 9-4 should be used
-  '0178 C3                 RET                      ', # Done
-  '0179 F9                 STC                      ', # Raise carry to signal error
-  '017A C3                 RET                      ', # Done
-  
-  # Subprogram: load cassette block buffer from disk if offset is at the beginning of it
-  # Pre: offset within cassette block buffer stored in [0000], block number stored in [0002]
-  # Post: if offset is 0, cassette block buffer loaded with cassette block; if offset was out of bounds, carry raised, else lowered
-  
-  '017B F7 06 00 00 FF FF  TEST WORD PTR [0000],FFFF', # If the offset within the buffer is nonzero, we don't need to do anything
-  '0181 75 19              JNZ  019C                ', #  "
-  '0183 B8 01 02           MOV  AX,0201             ', # Prepare to read one sector to memory
-  # fall through
-  
-  # Subprogram: perform an INT 13 call targeting the cassette block buffer
-  # Pre: INT 13 operation (typically read/write sectors) in AX
-  # Post: INT 13 operation performed; AX and carry are left at values set by INT 13
-  
-  '0186 53                 PUSH BX                  ', # Preserve registers that will be trashed
-  '0187 51                 PUSH CX                  ', #  "
-  '0188 52                 PUSH DX                  ', #  "
-  '0189 06                 PUSH ES                  ', #  "
-  '018A 50                 PUSH AX                  ', #  "
-  '018B E8 C6 FF           CALL 0154                ', # Set up CX and DX for an INT 13 operation
-  '018E 58                 POP  AX                  ', # Retrieve saved AX so we can use it
-  '018F 72 07              JB   0198                ', # If block out of bounds, pass carry to caller
-  '0191 0E                 PUSH CS                  ', # Point to buffer location in memory
-  '0192 07                 POP  ES                  ', #  "
-  '0193 BB 00 02           MOV  BX,0200             ', #  "
-  '0196 CD 13              INT  13                  ', # Perform operation, pass AX and carry on
-  '0198 07                 POP  ES                  ', # Restore trashed registers
-  '0199 5A                 POP  DX                  ', #  "
-  '019A 59                 POP  CX                  ', #  "
-  '019B 5B                 POP  BX                  ', #  "
-  '019C C3                 RET                      ', # Done
+  '019F 3B 0E F8 01        CMP  CX,[01F8]           ', # If block is out of bounds, raise carry and return to caller
+  '01A3 73 19              JNB  01BE                ', #  "
+  '01A5 89 C8              MOV  AX,CX               ', # Divide block number by sectors per track; the remainder is the sector
+  '01A7 31 D2              XOR  DX,DX               ', #  number, which we increment because sectors are 1-based
+  '01A9 F7 36 F4 01        DIV  WORD PTR [01F4]     ', #  "
+  '01AD 88 D1              MOV  CL,DL               ', #  "
+  '01AF FE C1              INC  CL                  ', #  "
+  '01B1 31 D2              XOR  DX,DX               ', # Divide the quotient by number of heads; the remainder is the head number
+  '01B3 F7 36 F6 01        DIV  WORD PTR [01F6]     ', #  and the quotient is the track number
+  '01B7 88 C5              MOV  CH,AL               ', #  "
+  '01B9 88 D6              MOV  DH,DL               ', #  "
+  '01BB 30 D2              XOR  DL,DL               ', # Set DL (drive number) to 0, clear carry
+  '01BD C3                 RET                      ', # Done
+  '01BE F9                 STC                      ', # Raise carry to signal error
+  '01BF C3                 RET                      ', # Done
+  
+  # Subprogram: make sure the cassette block is in the track buffer if offset is at the beginning of it
+  # Pre: offset within cassette block stored in [0000], block number stored in [0002]
+  # Post: if offset is 0, the track containing the cassette block is in the track buffer (the track that was there having been
+  #  written back first if it was changed), its index in the buffer is stored in [0008] and its address in [0006]; if block was
+  #  out of bounds or the disk couldn't be accessed, carry raised, else lowered
+  
+  '01C0 F7 06 00 00 FF FF  TEST WORD PTR [0000],FFFF', # If the offset within the block is nonzero, we don't need to do anything
+  '01C6 75 59              JNZ  0221                ', #  "
+  '01C8 50                 PUSH AX                  ', # Preserve registers that will be trashed
+  '01C9 51                 PUSH CX                  ', #  "
+  '01CA 52                 PUSH DX                  ', #  "
+  '01CB A1 02 00           MOV  AX,[0002]           ', # If cassette block number is out of bounds, raise carry and return
+  '01CE 3B 06 FA 01        CMP  AX,[01FA]           ', #  "
+  '01D2 73 54              JNB  0228                ', #  "
+  '01D4 03 06 0E 00        ADD  AX,[000E]           ', # Offset by the block where the cassette begins (past the tape directory)
+  '01D8 89 C1              MOV  CX,AX               ', # If the block is in the track buffer already, we don't need to touch the
+  '01DA 2B 06 04 00        SUB  AX,[0004]           ', #  disk
+  '01DE 3B 06 F4 01        CMP  AX,[01F4]           ', #  "
+  '01E2 72 2B              JB   020F                ', #  "
+  '01E4 E8 44 00           CALL 022B                ', # Write back the track in the buffer if it was changed, pass carry on if
+  '01E7 72 35              JB   021E                ', #  that failed
+  '01E9 89 C8              MOV  AX,CX               ', # Round block number down to the beginning of its track and make that the
+  '01EB 31 D2              XOR  DX,DX               ', #  buffered track
+  '01ED F7 36 F4 01        DIV  WORD PTR [01F4]     ', #  "
+  '01F1 29 D1              SUB  CX,DX               ', #  "
+  '01F3 89 0E 04 00        MOV  [0004],CX           ', #  "
+  '01F7 52                 PUSH DX                  ', # Read the whole track into the track buffer, keeping the block's index in
+  '01F8 E8 A4 FF           CALL 019F                ', #  it (the remainder)
+  '01FB A0 F4 01           MOV  AL,[01F4]           ', #  "
+  '01FE B4 02              MOV  AH,02               ', #  "
+  '0200 53                 PUSH BX                  ', #  "
+  '0201 06                 PUSH ES                  ', #  "
+  '0202 0E                 PUSH CS                  ', #  "
+  '0203 07                 POP  ES                  ', #  "
+  '0204 BB 00 10           MOV  BX,1000             ', #  "
+  '0207 E8 5A 04           CALL 0664                ', #  "
+  '020A 07                 POP  ES                  ', #  "
+  '020B 5B                 POP  BX                  ', #  "
+  '020C 58                 POP  AX                  ', #  "
+  '020D 72 13              JB   0222                ', # If that failed, mark track buffer empty (contents unknown), pass carry on
+  '020F A2 08 00           MOV  [0008],AL           ', # Save index of block in track buffer and calculate its address from it; the
+  '0212 88 C4              MOV  AH,AL               ', #  ADD will not carry, so carry will be low to indicate no error
+  '0214 D0 E4              SHL  AH,1                ', #  "
+  '0216 30 C0              XOR  AL,AL               ', #  "
+  '0218 05 00 10           ADD  AX,1000             ', #  "
+  '021B A3 06 00           MOV  [0006],AX           ', #  "
+  '021E 5A                 POP  DX                  ', # Restore trashed registers
+  '021F 59                 POP  CX                  ', #  "
+  '0220 58                 POP  AX                  ', #  "
+  '0221 C3                 RET                      ', # Done
+  '0222 C7 06 04 00 FF FF  MOV  WORD PTR [0004],FFFF', # Mark track buffer empty
+  '0228 F9                 STC                      ', # Raise carry to signal error
+  '0229 EB F3              JMP  021E                ', # Rejoin above
+  
+  # Subprogram: write changed blocks in the track buffer back to disk
+  # Pre: indices of the first changed block and the one after the last changed block stored in [000A] and [000B]
+  # Post: changed blocks written to disk in a single operation and track buffer marked unchanged; carry set on error
+  
+  '022B 50                 PUSH AX                  ', # Preserve registers that will be trashed
+  '022C 53                 PUSH BX                  ', #  "
+  '022D 51                 PUSH CX                  ', #  "
+  '022E 52                 PUSH DX                  ', #  "
+  '022F A0 0B 00           MOV  AL,[000B]           ', # Get number of changed blocks, if there are none, we don't need to do
+  '0232 2A 06 0A 00        SUB  AL,[000A]           ', #  anything
+  '0236 76 2E              JBE  0266                ', #  "
+  '0238 B4 03              MOV  AH,03               ', # Prepare to write that many sectors from memory
+  '023A 50                 PUSH AX                  ', #  "
+  '023B 8A 0E 0A 00        MOV  CL,[000A]           ', # Set up CX and DX for the first changed block
+  '023F 30 ED              XOR  CH,CH               ', #  "
+  '0241 03 0E 04 00        ADD  CX,[0004]           ', #  "
+  '0245 E8 57 FF           CALL 019F                ', #  "
+  '0248 58                 POP  AX                  ', # If the block is out of bounds, pass carry on
+  '0249 72 1C              JB   0267                ', #  "
+  '024B 8A 3E 0A 00        MOV  BH,[000A]           ', # Point BX to the first changed block in the track buffer
+  '024F D0 E7              SHL  BH,1                ', #  "
+  '0251 30 DB              XOR  BL,BL               ', #  "
+  '0253 81 C3 00 10        ADD  BX,1000             ', #  "
+  '0257 06                 PUSH ES                  ', # Write the changed blocks to disk, pass carry on if that failed
+  '0258 0E                 PUSH CS                  ', #  "
+  '0259 07                 POP  ES                  ', #  "
+  '025A E8 07 04           CALL 0664                ', #  "
+  '025D 07                 POP  ES                  ', #  "
+  '025E 72 07              JB   0267                ', #  "
+  '0260 C7 06 0A 00 FF 00  MOV  WORD PTR [000A],00FF', # Mark the track buffer unchanged
+  '0266 F8                 CLC                      ', # Clear carry to indicate no error
+  '0267 5A                 POP  DX                  ', # Restore trashed registers
+  '0268 59                 POP  CX                  ', #  "
+  '0269 5B                 POP  BX                  ', #  "
+  '026A 58                 POP  AX                  ', #  "
+  '026B C3                 RET                      ', # Done
+  
+  # Subprogram: mark the current cassette block in the track buffer as changed
+  # Pre: index of block in track buffer stored in [0008]
+  # Post: range of changed blocks stored in [000A] and [000B] widened to include current block
+  
+  '026C 50                 PUSH AX                  ', # Preserve AX
+  '026D A0 08 00           MOV  AL,[0008]           ', # If the current block is before the first changed block, it's the first
+  '0270 3A 06 0A 00        CMP  AL,[000A]           ', #  changed block now
+  '0274 73 03              JNB  0279                ', #  "
+  '0276 A2 0A 00           MOV  [000A],AL           ', #  "
+  '0279 FE C0              INC  AL                  ', # If the current block is after the last changed block, it's the last
+  '027B 3A 06 0B 00        CMP  AL,[000B]           ', #  changed block now
+  '027F 76 03              JBE  0284                ', #  "
+  '0281 A2 0B 00           MOV  [000B],AL           ', #  "
+  '0284 58                 POP  AX                  ', # Restore AX
+  '0285 C3                 RET                      ', # Done
   
   # Subprogram: write a byte to emulated cassette
   # Pre: AL contains byte to be written
-  # Post: AL written to buffer, offset incremented, carry set on error; if written at end of buffer, buffer written to disk, offset
-  #  reset to 0, block number incremented (but not loaded from disk yet)
-  
-  '019D 50                 PUSH AX                  ', # If at the top of buffer, load from disk
-  '019E E8 DA FF           CALL 017B                ', #  "
-  '01A1 58                 POP  AX                  ', #  "
-  '01A2 72 24              JB   01C8                ', # If there was an error, skip with carry set
-  '01A4 57                 PUSH DI                  ', # Write the byte to the buffer
-  '01A5 8B 3E 00 00        MOV  DI,[0000]           ', #  "
-  '01A9 88 85 00 02        MOV  [DI+0200],AL        ', #  "
-  '01AD 47                 INC  DI                  ', # If we're at the end of the buffer, write it to disk, because we know it's
-  '01AE F7 C7 FF 01        TEST DI,01FF             ', #  changed, advance to the top of the next block, and preserve carry in case
-  '01B2 75 0F              JNZ  01C3                ', #  the write errored; TEST ensures that carry flag is low to indicate no
-  '01B4 50                 PUSH AX                  ', #  error
-  '01B5 B8 01 03           MOV  AX,0301             ', #  "
-  '01B8 E8 CB FF           CALL 0186                ', #  "
-  '01BB 58                 POP  AX                  ', #  "
-  '01BC BF 00 00           MOV  DI,0000             ', #  "
-  '01BF FF 06 02 00        INC  WORD PTR [0002]     ', #  "
-  '01C3 89 3E 00 00        MOV  [0000],DI           ', # Save changed offset in buffer
-  '01C7 5F                 POP  DI                  ', #  "
-  '01C8 C3                 RET                      ', # Done
+  # Post: AL written to track buffer, offset incremented, carry set on error; if written at the top of a block, block marked as
+  #  changed; if written at end of block, offset reset to 0, block number incremented (but not loaded from disk yet)
+  
+  '0286 F7 06 00 00 FF FF  TEST WORD PTR [0000],FFFF', # If at the top of a block, make sure it's in the track buffer and mark it
+  '028C 75 08              JNZ  0296                ', #  as changed
+  '028E E8 37 FF           CALL 01C8                ', #  "
+  '0291 72 24              JB   02B7                ', #  "
+  '0293 E8 D6 FF           CALL 026C                ', #  "
+  '0296 57                 PUSH DI                  ', # Write the byte to the track buffer
+  '0297 8B 3E 06 00        MOV  DI,[0006]           ', #  "
+  '029B 03 3E 00 00        ADD  DI,[0000]           ', #  "
+  '029F 88 05              MOV  [DI],AL             ', #  "
+  '02A1 2B 3E 06 00        SUB  DI,[0006]           ', #  "
+  '02A5 47                 INC  DI                  ', # If we're at the end of the block, advance to the top of the next one; both
+  '02A6 F7 C7 FF 01        TEST DI,01FF             ', #  TEST and XOR ensure that carry flag is low to indicate no error
+  '02AA 75 06              JNZ  02B2                ', #  "
+  '02AC 31 FF              XOR  DI,DI               ', #  "
+  '02AE FF 06 02 00        INC  WORD PTR [0002]     ', #  "
+  '02B2 89 3E 00 00        MOV  [0000],DI           ', # Save changed offset in block
+  '02B6 5F                 POP  DI                  ', #  "
+  '02B7 C3                 RET                      ', # Done
   
   # Subprogram: read a byte from emulated cassette
-  # Post: AL contains byte read from cassette, offset incremented, carry set on error; if read from end of buffer, offset reset to
+  # Post: AL contains byte read from cassette, offset incremented, carry set on error; if read from end of block, offset reset to
   #  0 and block number incremented (but not loaded from disk yet)
   
-  '01C9 E8 AF FF           CALL 017B                ', # If at the top of buffer, load from disk
-  '01CC 72 1B              JB   01E9                ', # If there was an error, skip with carry set
-  '01CE 57                 PUSH DI                  ', # Read the byte from the buffer
-  '01CF 8B 3E 00 00        MOV  DI,[0000]           ', #  "
-  '01D3 8A 85 00 02        MOV  AL,[DI+0200]        ', #  "
-  '01D7 47                 INC  DI                  ', # If we're at the end of the buffer, advance to the top of the next sector;
-  '01D8 F7 C7 FF 01        TEST DI,01FF             ', #  both TEST and XOR ensure that carry flag is low to indicate no error
-  '01DC 75 06              JNZ  01E4                ', #  "
-  '01DE 31 FF              XOR  DI,DI               ', #  "
-  '01E0 FF 06 02 00        INC  WORD PTR [0002]     ', #  "
-  '01E4 89 3E 00 00        MOV  [0000],DI           ', # Save changed offset in buffer
-  '01E8 5F                 POP  DI                  ', #  "
-  '01E9 C3                 RET                      ', # Done
+  '02B8 E8 05 FF           CALL 01C0                ', # If at the top of a block, make sure it's in the track buffer
+  '02BB 72 21              JB   02DE                ', # If there was an error, skip with carry set
+  '02BD 57                 PUSH DI                  ', # Read the byte from the track buffer
+  '02BE 8B 3E 06 00        MOV  DI,[0006]           ', #  "
+  '02C2 03 3E 00 00        ADD  DI,[0000]           ', #  "
+  '02C6 8A 05              MOV  AL,[DI]             ', #  "
+  '02C8 2B 3E 06 00        SUB  DI,[0006]           ', #  "
+  '02CC 47                 INC  DI                  ', # If we're at the end of the block, advance to the top of the next one; both
+  '02CD F7 C7 FF 01        TEST DI,01FF             ', #  TEST and XOR ensure that carry flag is low to indicate no error
+  '02D1 75 06              JNZ  02D9                ', #  "
+  '02D3 31 FF              XOR  DI,DI               ', #  "
+  '02D5 FF 06 02 00        INC  WORD PTR [0002]     ', #  "
+  '02D9 89 3E 00 00        MOV  [0000],DI           ', # Save changed offset in block
+  '02DD 5F                 POP  DI                  ', #  "
+  '02DE C3                 RET                      ', # Done
   
-  # Interrupt handler for INT 15 (cassette operations)
+  # Subprogram: factor a byte into the CRC using the lookup table
+  # Pre: AL contains byte, DX contains CRC
+  # Post: DX contains updated CRC
+  
+  '02DF 53                 PUSH BX                  ', # Preserve BX
+  '02E0 88 C3              MOV  BL,AL               ', # Look up the table entry for the byte XORed with the upper byte of the CRC,
+  '02E2 30 F3              XOR  BL,DH               ', #  shift the CRC left by eight bits, and XOR the entry into it
+  '02E4 B7 08              MOV  BH,08               ', #  "
+  '02E6 8A 37              MOV  DH,[BX]             ', #  "
+  '02E8 30 D6              XOR  DH,DL               ', #  "
+  '02EA 8A 97 00 01        MOV  DL,[BX+0100]        ', #  "
+  '02EE 5B                 POP  BX                  ', # Restore BX
+  '02EF C3                 RET                      ', # Done
+  
+  # Trailer of the boot sector; the INT 15 handler is in the sectors after it
+  
+  '02F0 00 00 00 00        DB   00,00,00,00         ', # Free space
+  
+  # Diskette geometry (cassbox.py fills these in to suit the image it builds)
+  
+  '02F4 08 00              DW   0008                ', # Sectors per track
+  '02F6 02 00              DW   0002                ', # Number of heads
+  '02F8 80 02              DW   0280                ', # Number of blocks on diskette
+  '02FA 3B 02              DW   023B                ', # Number of blocks on cassette (all that's past the tape directory)
+  '02FC FE 1E              DW   1EFE                ', # Highest address in track buffer where a cassette block and its CRC fit
   
-  '01EA FB                 STI                      ', # Reenable interrupts
-  '01EB 1E                 PUSH DS                  ', # Save old DS
-  '01EC 0E                 PUSH CS                  ', # DS must equal CS for cassette location variable access
-  '01ED 1F                 POP  DS                  ', #  "
-  '01EE 08 E4              OR   AH,AH               ', # If AH is 0, turn on motor, which we ignore (OR sets carry low so no error)
-  '01F0 74 0F              JZ   0201                ', #  "
-  '01F2 FE CC              DEC  AH                  ', # If AH is 1, turn off motor, which we ignore (DEC doesn't affect carry so
-  '01F4 74 0B              JZ   0201                ', #  no error)
-  '01F6 FE CC              DEC  AH                  ', # If AH is 2, read from cassette
-  '01F8 74 0B              JZ   0205                ', #  "
-  '01FA FE CC              DEC  AH                  ', # If AH is 3, write to cassette
-  '01FC 74 38              JZ   0236                ', #  "
-  '01FE B4 80              MOV  AH,80               ', # If AH is none of these, return 0x80 in AH and set carry to indicate an
-  '0200 F9                 STC                      ', #  error
-  '0201 1F                 POP  DS                  ', #  "
-  '0202 CA 02 00           RETF 0002                ', # Return to caller, preserving flags
-  '0205 55                 PUSH BP                  ', # Preserve the registers that we will trash
-  '0206 57                 PUSH DI                  ', #  "
-  '0207 56                 PUSH SI                  ', #  "
-  '0208 89 CF              MOV  DI,CX               ', # Move CX into DI so we can use CX to loop
-  '020A 31 D2              XOR  DX,DX               ', # Set/reset 0xFF counter to zero
-  '020C E8 BA FF           CALL 01C9                ', # Get a byte from the cassette
-  '020F 72 68              JB   0279                ', # If we errored, handle it
-  '0211 3C FF              CMP  AL,FF               ', # If the byte we received is anything but 0xFF, reset to zero and try again
-  '0213 75 F5              JNZ  020A                ', #  "
-  '0215 FE C2              INC  DL                  ', # If it's 0xFF, increment the 0xFF counter
-  '0217 80 FA 80           CMP  DL,80               ', # Loop until we get 128 consecutive 0xFFs
-  '021A 75 F0              JNZ  020C                ', #  "
-  '021C E8 AA FF           CALL 01C9                ', # Get a byte from the cassette
-  '021F 72 58              JB   0279                ', # If we errored, handle it
-  '0221 3C FE              CMP  AL,FE               ', # If the byte we got is an 0xFE, that's our sync bit, so jump ahead
-  '0223 74 06              JZ   022B                ', #  "
-  '0225 3C FF              CMP  AL,FF               ', # If the byte we got is another 0xFF, keep on waiting for our sync bit
-  '0227 74 F3              JZ   021C                ', #  "
-  '0229 EB DF              JMP  020A                ', # Other byte values mean starting over
-  '022B E8 9B FF           CALL 01C9                ', # Get a byte from the cassette
-  '022E 72 49              JB   0279                ', # If we errored, handle it
-  '0230 3C 16              CMP  AL,16               ', # If the byte we got is 0x16, that's our sync byte, so jump ahead
-  '0232 74 04              JZ   0238                ', #  "
-  '0234 EB D4              JMP  020A                ', # Other byte values mean starting over
-  '0236 EB 4A              JMP  0282                ', # (Write needs this because it's out of range)
-  '0238 31 ED              XOR  BP,BP               ', # Use BP to count actual-read bytes
-  '023A BA FF FF           MOV  DX,FFFF             ', # Initialize CRC register to 0xFFFF
-  '023D BE 02 01           MOV  SI,0102             ', # Initialize counter to 258
-  '0240 E8 86 FF           CALL 01C9                ', # Get a byte from the cassette
-  '0243 72 34              JB   0279                ', # If we errored, handle it
-  '0245 30 C6              XOR  DH,AL               ', # Factor it into the CRC
-  '0247 B9 08 00           MOV  CX,0008             ', #  "
-  '024A D1 E2              SHL  DX,1                ', #  "
-  '024C 73 04              JNB  0252                ', #  "
-  '024E 81 F2 21 10        XOR  DX,1021             ', #  "
-  '0252 E2 F6              LOOP 024A                ', #  "
-  '0254 83 FE 02           CMP  SI,+02              ', # If we're reading the CRC, don't write to the output buffer
-  '0257 7E 0A              JLE  0263                ', #  "
-  '0259 09 FF              OR   DI,DI               ', # If we've reached the end of the number of bytes requested to read, jump
-  '025B 74 06              JZ   0263                ', #  ahead
-  '025D 4F                 DEC  DI                  ', # Decrement the number of bytes requested
-  '025E 45                 INC  BP                  ', # Increment the number of bytes read
-  '025F 26                 ES:                      ', # Move the byte to the output buffer and advance the pointer
-  '0260 88 07              MOV  [BX],AL             ', #  "
-  '0262 43                 INC  BX                  ', #  "
-  '0263 4E                 DEC  SI                  ', # Decrement the counter and loop until we've read an entire 256-byte block
-  '0264 75 DA              JNZ  0240                ', #  "
-  '0266 81 FA 0F 1D        CMP  DX,1D0F             ', # If the CRC is bad, handle it as an error
-  '026A 75 11              JNZ  027D                ', #  "
-  '026C 09 FF              OR   DI,DI               ', # If we have bytes left to read, read another block
-  '026E 75 CA              JNZ  023A                ', #  "
-  '0270 30 E4              XOR  AH,AH               ', # Clear carry and set AH to 0 to for no error
-  '0272 89 EA              MOV  DX,BP               ', # Return total bytes read in DX
-  '0274 5E                 POP  SI                  ', # Restore registers
-  '0275 5F                 POP  DI                  ', #  "
-  '0276 5D                 POP  BP                  ', #  "
-  '0277 EB 88              JMP  0201                ', # Done
-  '0279 B4 02              MOV  AH,02               ', # Return "bad tape signals" error code
-  '027B EB 02              JMP  027F                ', #  "
-  '027D B4 01              MOV  AH,01               ', # Return "CRC error" error code
-  '027F F9                 STC                      ', # Set carry to indicate an error
-  '0280 EB F0              JMP  0272                ', # Rejoin above
-  '0282 55                 PUSH BP                  ', # Preserve the registers that we will trash
-  '0283 57                 PUSH DI                  ', #  "
-  '0284 56                 PUSH SI                  ', #  "
-  '0285 89 D5              MOV  BP,DX               ', # Preserve DX, we'll write it back later
-  '0287 89 CF              MOV  DI,CX               ', # Move CX into DI so we can use CX to loop
-  '0289 B9 3E 01           MOV  CX,013E             ', # Write 318 0xFFs to cassette
-  '028C B0 FF              MOV  AL,FF               ', #  "
-  '028E E8 0C FF           CALL 019D                ', #  "
-  '0291 72 E6              JB   0279                ', #  "
-  '0293 E2 F9              LOOP 028E                ', #  "
-  '0295 B0 FE              MOV  AL,FE               ', # Write sync bit to cassette
-  '0297 E8 03 FF           CALL 019D                ', #  "
-  '029A 72 DD              JB   0279                ', # If we errored, handle it
-  '029C B0 16              MOV  AL,16               ', # Write sync byte to cassette
-  '029E E8 FC FE           CALL 019D                ', #  "
-  '02A1 72 D6              JB   0279                ', # If we errored, handle it
-  '02A3 BA FF FF           MOV  DX,FFFF             ', # Initialize CRC
-  '02A6 BE 00 01           MOV  SI,0100             ', # Cassette block is 256 bytes
-  '02A9 09 FF              OR   DI,DI               ', # If we've written requested bytes, don't read more from buffer
-  '02AB 74 05              JZ   02B2                ', #  "
-  '02AD 26                 ES:                      ', # Pick up the next byte to read
-  '02AE 8A 07              MOV  AL,[BX]             ', #  "
-  '02B0 43                 INC  BX                  ', # Increment the buffer pointer
-  '02B1 4F                 DEC  DI                  ', # Decrement the count of bytes to write
-  '02B2 E8 E8 FE           CALL 019D                ', # Write byte to cassette
-  '02B5 72 C2              JB   0279                ', # If we errored, handle it
-  '02B7 30 C6              XOR  DH,AL               ', # Factor written byte into the CRC
-  '02B9 B9 08 00           MOV  CX,0008             ', #  "
-  '02BC D1 E2              SHL  DX,1                ', #  "
-  '02BE 73 04              JNB  02C4                ', #  "
-  '02C0 81 F2 21 10        XOR  DX,1021             ', #  "
-  '02C4 E2 F6              LOOP 02BC                ', #  "
-  '02C6 4E                 DEC  SI                  ', # Decrement bytes left in block
-  '02C7 75 E0              JNZ  02A9                ', # Loop to send the next if any are left
-  '02C9 F7 D2              NOT  DX                  ', # Ones' complement the CRC and write to cassette, upper byte first
-  '02CB 88 F0              MOV  AL,DH               ', #  "
-  '02CD E8 CD FE           CALL 019D                ', #  "
-  '02D0 72 A7              JB   0279                ', #  "
-  '02D2 88 D0              MOV  AL,DL               ', #  "
-  '02D4 E8 C6 FE           CALL 019D                ', #  "
-  '02D7 72 A0              JB   0279                ', #  "
-  '02D9 09 FF              OR   DI,DI               ', # If bytes are left to write, loop to write another block
-  '02DB 75 C6              JNZ  02A3                ', #  "
-  '02DD B9 04 00           MOV  CX,0004             ', # Write trailer to cassette
-  '02E0 B0 FF              MOV  AL,FF               ', #  "
-  '02E2 E8 B8 FE           CALL 019D                ', #  "
-  '02E5 72 92              JB   0279                ', #  "
-  '02E7 E2 F9              LOOP 02E2                ', #  "
-  '02E9 F7 06 00 00 FF FF  TEST WORD PTR [0000],FFFF', # Unless we already did it, write the current  sector to disk and, if
-  '02EF 74 08              JZ   02F9                ', #  nothing goes wrong, return no error
-  '02F1 B8 01 03           MOV  AX,0301             ', #  "
-  '02F4 E8 A6 FE           CALL 019D                ', #  "
-  '02F7 72 80              JB   0279                ', #  "
-  '02F9 E9 74 FF           JMP  0270                ', #  "
-  
-  # Trailer
-  
-  '02FC 00 00              DB   00,00               ', # Free space
   '02FE 55 AA              DB   55,AA               ', # MBR signature
   
+  # Interrupt handler for INT 15 (cassette operations)
+  
+  '0300 FB                 STI                      ', # Reenable interrupts
+  '0301 FC                 CLD                      ', # String operations go forward
+  '0302 1E                 PUSH DS                  ', # Save old DS
+  '0303 0E                 PUSH CS                  ', # DS must equal CS for cassette location variable access
+  '0304 1F                 POP  DS                  ', #  "
+  '0305 80 3E 0D 00 00     CMP  BYTE PTR [000D],00  ', # If a tape was asked for with a POKE, switch to it first (if that fails,
+  '030A 74 03              JZ   030F                ', #  carry on regardless)
+  '030C E8 BE 03           CALL 06CD                ', #  "
+  '030F 08 E4              OR   AH,AH               ', # If AH is 0, turn on motor, which we ignore (OR sets carry low so no error)
+  '0311 74 21              JZ   0334                ', #  "
+  '0313 FE CC              DEC  AH                  ', # If AH is 1, turn off motor, which we ignore except to save the counters
+  '0315 74 21              JZ   0338                ', #  "
+  '0317 FE CC              DEC  AH                  ', # If AH is 2, read from cassette
+  '0319 74 20              JZ   033B                ', #  "
+  '031B FE CC              DEC  AH                  ', # If AH is 3, write to cassette
+  '031D 74 55              JZ   0374                ', #  "
+  '031F FE CC              DEC  AH                  ', # If AH is 4, seek to a file in the tape directory
+  '0321 74 54              JZ   0377                ', #  "
+  '0323 FE CC              DEC  AH                  ', # If AH is 5, select a tape in the tape library
+  '0325 74 53              JZ   037A                ', #  "
+  '0327 B4 80              MOV  AH,80               ', # If AH is none of these, count the error, return 0x80 in AH and set carry
+  '0329 83 06 EC 0B 01     ADD  WORD PTR [0BEC],+01 ', #  to indicate an error
+  '032E 83 16 EE 0B 00     ADC  WORD PTR [0BEE],+00 ', #  "
+  '0333 F9                 STC                      ', #  "
+  '0334 1F                 POP  DS                  ', #  "
+  '0335 CA 02 00           RETF 0002                ', # Return to caller, preserving flags
+  '0338 E9 4E 03           JMP  0689                ', # (Motor off needs this because it's out of range)
+  '033B 55                 PUSH BP                  ', # Preserve the registers that we will trash
+  '033C 57                 PUSH DI                  ', #  "
+  '033D 56                 PUSH SI                  ', #  "
+  '033E 89 CF              MOV  DI,CX               ', # Move CX into DI so we can use CX to loop
+  '0340 8B 2E 02 00        MOV  BP,[0002]           ', # Keep the position where we started looking for a leader in BP and SI
+  '0344 8B 36 00 00        MOV  SI,[0000]           ', #  "
+  '0348 31 D2              XOR  DX,DX               ', # Set/reset 0xFF counter to zero
+  '034A E8 6B FF           CALL 02B8                ', # Get a byte from the cassette
+  '034D 72 3B              JB   038A                ', # If we errored, handle it
+  '034F 3C FF              CMP  AL,FF               ', # If the byte we received is anything but 0xFF, see if it's a leader token
+  '0351 75 2A              JNZ  037D                ', #  "
+  '0353 FE C2              INC  DL                  ', # If it's 0xFF, increment the 0xFF counter
+  '0355 80 FA 80           CMP  DL,80               ', # Loop until we get 128 consecutive 0xFFs
+  '0358 75 F0              JNZ  034A                ', #  "
+  '035A E8 5B FF           CALL 02B8                ', # Get a byte from the cassette
+  '035D 72 2B              JB   038A                ', # If we errored, handle it
+  '035F 3C FE              CMP  AL,FE               ', # If the byte we got is an 0xFE, that's our sync bit, so jump ahead
+  '0361 74 06              JZ   0369                ', #  "
+  '0363 3C FF              CMP  AL,FF               ', # If the byte we got is another 0xFF, keep on waiting for our sync bit
+  '0365 74 F3              JZ   035A                ', #  "
+  '0367 EB 41              JMP  03AA                ', # Other byte values mean starting over
+  '0369 E8 4C FF           CALL 02B8                ', # Get a byte from the cassette
+  '036C 72 1C              JB   038A                ', # If we errored, handle it
+  '036E 3C 16              CMP  AL,16               ', # If the byte we got is 0x16, that's our sync byte, so jump ahead
+  '0370 74 44              JZ   03B6                ', #  "
+  '0372 EB 36              JMP  03AA                ', # Other byte values mean starting over
+  '0374 E9 8C 00           JMP  0403                ', # (Write needs this because it's out of range)
+  '0377 E9 64 02           JMP  05DE                ', # (Seek needs this because it's out of range)
+  '037A E9 35 03           JMP  06B2                ', # (Select needs this because it's out of range)
+  '037D 3C FD              CMP  AL,FD               ', # If it's a leader token and the tape is compact, it stands in for a whole
+  '037F 75 C7              JNZ  0348                ', #  leader, so go straight to waiting for our sync bit; anything else, reset
+  '0381 F6 06 F0 0B 01     TEST BYTE PTR [0BF0],01  ', #  to zero and try again
+  '0386 74 C0              JZ   0348                ', #  "
+  '0388 EB D0              JMP  035A                ', #  "
+  '038A E8 B8 02           CALL 0645                ', # If we errored looking for a leader, count the bytes we went past first
+  '038D B4 02              MOV  AH,02               ', # Return "bad tape signals" error code
+  '038F EB 02              JMP  0393                ', #  "
+  '0391 B4 01              MOV  AH,01               ', # Return "CRC error" error code
+  '0393 53                 PUSH BX                  ', # Count the error by its code
+  '0394 88 E3              MOV  BL,AH               ', #  "
+  '0396 30 FF              XOR  BH,BH               ', #  "
+  '0398 D1 E3              SHL  BX,1                ', #  "
+  '039A D1 E3              SHL  BX,1                ', #  "
+  '039C 83 87 DC 0B 01     ADD  WORD PTR [BX+0BDC],+01', #  "
+  '03A1 83 97 DE 0B 00     ADC  WORD PTR [BX+0BDE],+00', #  "
+  '03A6 5B                 POP  BX                  ', #  "
+  '03A7 F9                 STC                      ', # Set carry to indicate an error
+  '03A8 EB 51              JMP  03FB                ', # Rejoin above
+  '03AA 83 06 DC 0B 01     ADD  WORD PTR [0BDC],+01 ', # Count a sync restart and start over looking for a leader
+  '03AF 83 16 DE 0B 00     ADC  WORD PTR [0BDE],+00 ', #  "
+  '03B4 EB 92              JMP  0348                ', #  "
+  '03B6 E8 8C 02           CALL 0645                ', # Count the bytes we went past to get here
+  '03B9 31 ED              XOR  BP,BP               ', # Use BP to count actual-read bytes
+  '03BB BA FF FF           MOV  DX,FFFF             ', # Initialize CRC register to 0xFFFF
+  '03BE E8 FF FD           CALL 01C0                ', # If at the top of a block, make sure it's in the track buffer
+  '03C1 72 CA              JB   038D                ', # If we errored, handle it
+  '03C3 E8 3A 01           CALL 0500                ', # Read the cassette block the fast way if we can
+  '03C6 73 27              JNB  03EF                ', #  "
+  '03C8 BE 02 01           MOV  SI,0102             ', # Initialize counter to 258
+  '03CB E8 EA FE           CALL 02B8                ', # Get a byte from the cassette
+  '03CE 72 BD              JB   038D                ', # If we errored, handle it
+  '03D0 E8 0C FF           CALL 02DF                ', # Factor it into the CRC
+  '03D3 83 FE 02           CMP  SI,+02              ', # If we're reading the CRC, don't write to the output buffer
+  '03D6 7E 14              JLE  03EC                ', #  "
+  '03D8 09 FF              OR   DI,DI               ', # If we've reached the end of the number of bytes requested to read, jump
+  '03DA 74 10              JZ   03EC                ', #  ahead
+  '03DC 4F                 DEC  DI                  ', # Decrement the number of bytes requested
+  '03DD 45                 INC  BP                  ', # Increment the number of bytes read and count it
+  '03DE 83 06 D0 0B 01     ADD  WORD PTR [0BD0],+01 ', #  "
+  '03E3 83 16 D2 0B 00     ADC  WORD PTR [0BD2],+00 ', #  "
+  '03E8 26                 ES:                      ', # Move the byte to the output buffer and advance the pointer
+  '03E9 88 07              MOV  [BX],AL             ', #  "
+  '03EB 43                 INC  BX                  ', #  "
+  '03EC 4E                 DEC  SI                  ', # Decrement the counter and loop until we've read an entire 256-byte block
+  '03ED 75 DC              JNZ  03CB                ', #  "
+  '03EF 81 FA 0F 1D        CMP  DX,1D0F             ', # If the CRC is bad, handle it as an error
+  '03F3 75 9C              JNZ  0391                ', #  "
+  '03F5 09 FF              OR   DI,DI               ', # If we have bytes left to read, read another block
+  '03F7 75 C2              JNZ  03BB                ', #  "
+  '03F9 30 E4              XOR  AH,AH               ', # Clear carry and set AH to 0 to for no error
+  '03FB 89 EA              MOV  DX,BP               ', # Return total bytes read in DX
+  '03FD 5E                 POP  SI                  ', # Restore registers
+  '03FE 5F                 POP  DI                  ', #  "
+  '03FF 5D                 POP  BP                  ', #  "
+  '0400 E9 31 FF           JMP  0334                ', # Done
+  '0403 55                 PUSH BP                  ', # Preserve the registers that we will trash
+  '0404 57                 PUSH DI                  ', #  "
+  '0405 56                 PUSH SI                  ', #  "
+  '0406 89 D5              MOV  BP,DX               ', # Preserve DX, we'll write it back later
+  '0408 89 CF              MOV  DI,CX               ', # Move CX into DI so we can use CX to loop
+  '040A F7 06 00 00 FF FF  TEST WORD PTR [0000],FFFF', # If we're starting in the middle of a block, mark it as changed (if we're
+  '0410 74 03              JZ   0415                ', #  at the top of one, writing to it will do that)
+  '0412 E8 57 FE           CALL 026C                ', #  "
+  '0415 B9 3E 01           MOV  CX,013E             ', # Write 318 0xFFs to cassette, or, if the tape is compact, a leader token in
+  '0418 B0 FF              MOV  AL,FF               ', #  their place
+  '041A F6 06 F0 0B 01     TEST BYTE PTR [0BF0],01  ', #  "
+  '041F 74 05              JZ   0426                ', #  "
+  '0421 B9 01 00           MOV  CX,0001             ', #  "
+  '0424 B0 FD              MOV  AL,FD               ', #  "
+  '0426 E8 9A 00           CALL 04C3                ', #  "
+  '0429 72 74              JB   049F                ', #  "
+  '042B B0 FE              MOV  AL,FE               ', # Write sync bit to cassette
+  '042D E8 56 FE           CALL 0286                ', #  "
+  '0430 72 6D              JB   049F                ', # If we errored, handle it
+  '0432 B0 16              MOV  AL,16               ', # Write sync byte to cassette
+  '0434 E8 4F FE           CALL 0286                ', #  "
+  '0437 72 66              JB   049F                ', # If we errored, handle it
+  '0439 BA FF FF           MOV  DX,FFFF             ', # Initialize CRC
+  '043C F7 06 00 00 FF FF  TEST WORD PTR [0000],FFFF', # If at the top of a block, make sure it's in the track buffer and mark it
+  '0442 75 08              JNZ  044C                ', #  as changed
+  '0444 E8 81 FD           CALL 01C8                ', #  "
+  '0447 72 56              JB   049F                ', #  "
+  '0449 E8 20 FE           CALL 026C                ', #  "
+  '044C E8 0A 01           CALL 0559                ', # Write the cassette block the fast way if we can
+  '044F 73 31              JNB  0482                ', #  "
+  '0451 BE 00 01           MOV  SI,0100             ', # Cassette block is 256 bytes
+  '0454 09 FF              OR   DI,DI               ', # If we've written requested bytes, don't read more from buffer
+  '0456 74 0F              JZ   0467                ', #  "
+  '0458 26                 ES:                      ', # Pick up the next byte to read
+  '0459 8A 07              MOV  AL,[BX]             ', #  "
+  '045B 43                 INC  BX                  ', # Increment the buffer pointer
+  '045C 4F                 DEC  DI                  ', # Decrement the count of bytes to write
+  '045D 83 06 D4 0B 01     ADD  WORD PTR [0BD4],+01 ', # Count the byte written
+  '0462 83 16 D6 0B 00     ADC  WORD PTR [0BD6],+00 ', #  "
+  '0467 E8 1C FE           CALL 0286                ', # Write byte to cassette
+  '046A 72 33              JB   049F                ', # If we errored, handle it
+  '046C E8 70 FE           CALL 02DF                ', # Factor written byte into the CRC
+  '046F 4E                 DEC  SI                  ', # Decrement bytes left in block
+  '0470 75 E2              JNZ  0454                ', # Loop to send the next if any are left
+  '0472 F7 D2              NOT  DX                  ', # Ones' complement the CRC and write to cassette, upper byte first
+  '0474 88 F0              MOV  AL,DH               ', #  "
+  '0476 E8 0D FE           CALL 0286                ', #  "
+  '0479 72 24              JB   049F                ', #  "
+  '047B 88 D0              MOV  AL,DL               ', #  "
+  '047D E8 06 FE           CALL 0286                ', #  "
+  '0480 72 1D              JB   049F                ', #  "
+  '0482 09 FF              OR   DI,DI               ', # If bytes are left to write, loop to write another block
+  '0484 75 B3              JNZ  0439                ', #  "
+  '0486 F6 06 F0 0B 01     TEST BYTE PTR [0BF0],01  ', # Write trailer to cassette, unless the tape is compact
+  '048B 75 0A              JNZ  0497                ', #  "
+  '048D B9 04 00           MOV  CX,0004             ', #  "
+  '0490 B0 FF              MOV  AL,FF               ', #  "
+  '0492 E8 2E 00           CALL 04C3                ', #  "
+  '0495 72 08              JB   049F                ', #  "
+  '0497 E8 91 FD           CALL 022B                ', # Write the changed blocks in the track buffer to disk and, if nothing goes
+  '049A 72 03              JB   049F                ', #  wrong, return no error
+  '049C E9 5A FF           JMP  03F9                ', #  "
+  '049F E9 EB FE           JMP  038D                ', # (Write needs this because bad is out of range)
+  
+  # Subprogram: advance emulated cassette within the track buffer
+  # Pre: CX contains number of bytes to advance by, which must not take us more than one block ahead
+  # Post: offset (and, if we went past the end of the block, block number and block's index and address in track buffer)
+  #  advanced, CX trashed
+  
+  '04A2 03 0E 00 00        ADD  CX,[0000]           ', # Advance offset, if that takes us past the end of the block, advance to the
+  '04A6 81 F9 00 02        CMP  CX,0200             ', #  next one
+  '04AA 72 12              JB   04BE                ', #  "
+  '04AC 81 E9 00 02        SUB  CX,0200             ', #  "
+  '04B0 FF 06 02 00        INC  WORD PTR [0002]     ', #  "
+  '04B4 81 06 06 00 00 02  ADD  WORD PTR [0006],0200', #  "
+  '04BA FE 06 08 00        INC  BYTE PTR [0008]     ', #  "
+  '04BE 89 0E 00 00        MOV  [0000],CX           ', # Save changed offset in block
+  '04C2 C3                 RET                      ', # Done
+  
+  # Subprogram: write a run of the same byte to emulated cassette
+  # Pre: AL contains byte to be written, CX contains number of times to write it (at least 1)
+  # Post: AL written to track buffer CX times, a block at a time, offset advanced, carry set on error; blocks written to marked as
+  #  changed; CX trashed
+  
+  '04C3 57                 PUSH DI                  ', # Preserve registers that will be trashed
+  '04C4 06                 PUSH ES                  ', #  "
+  '04C5 0E                 PUSH CS                  ', # Point ES to the track buffer
+  '04C6 07                 POP  ES                  ', #  "
+  '04C7 F7 06 00 00 FF FF  TEST WORD PTR [0000],FFFF', # If at the top of a block, make sure it's in the track buffer and mark it
+  '04CD 75 08              JNZ  04D7                ', #  as changed
+  '04CF E8 F6 FC           CALL 01C8                ', #  "
+  '04D2 72 29              JB   04FD                ', #  "
+  '04D4 E8 95 FD           CALL 026C                ', #  "
+  '04D7 BF 00 02           MOV  DI,0200             ', # Get the number of bytes we'll write to this block: the number left to
+  '04DA 2B 3E 00 00        SUB  DI,[0000]           ', #  write or the number left in the block, whichever is smaller
+  '04DE 39 CF              CMP  DI,CX               ', #  "
+  '04E0 72 02              JB   04E4                ', #  "
+  '04E2 89 CF              MOV  DI,CX               ', #  "
+  '04E4 29 F9              SUB  CX,DI               ', # Subtract them from the number left to write
+  '04E6 51                 PUSH CX                  ', #  "
+  '04E7 89 F9              MOV  CX,DI               ', # Write them to the track buffer and advance past them
+  '04E9 8B 3E 06 00        MOV  DI,[0006]           ', #  "
+  '04ED 03 3E 00 00        ADD  DI,[0000]           ', #  "
+  '04F1 51                 PUSH CX                  ', #  "
+  '04F2 F3                 REPZ                     ', #  "
+  '04F3 AA                 STOSB                    ', #  "
+  '04F4 59                 POP  CX                  ', #  "
+  '04F5 E8 AA FF           CALL 04A2                ', #  "
+  '04F8 59                 POP  CX                  ', # Loop if any are left to write; OR ensures that carry flag is low to
+  '04F9 09 C9              OR   CX,CX               ', #  indicate no error
+  '04FB 75 CA              JNZ  04C7                ', #  "
+  '04FD 07                 POP  ES                  ', # Restore trashed registers
+  '04FE 5F                 POP  DI                  ', #  "
+  '04FF C3                 RET                      ', # Done
+  
+  # Subprogram: read a cassette block and its CRC from the track buffer all at once
+  # Pre: cassette block in track buffer, DX contains initial CRC, ES:BX points to output buffer, DI contains number of bytes
+  #  requested, BP contains number of bytes read
+  # Post: if the cassette block and its CRC are entirely within the track buffer and end before the tape's last block, CRC
+  #  factored into DX, up to 256 bytes copied to output buffer and DI, BP, and BX updated accordingly, cassette advanced past
+  #  them, and carry lowered; else carry raised and nothing changed; AX, CX, SI trashed
+  
+  '0500 8B 0E 02 00        MOV  CX,[0002]           ', # If the cassette block and its CRC might run past the end of the tape (into
+  '0504 41                 INC  CX                  ', #  the next one, in a tape library), go the slow way, byte by byte, which
+  '0505 3B 0E FA 01        CMP  CX,[01FA]           ', #  stops at the end of the tape
+  '0509 73 4C              JNB  0557                ', #  "
+  '050B 8B 36 06 00        MOV  SI,[0006]           ', # If the cassette block and its CRC don't fit in what's left of the track
+  '050F 03 36 00 00        ADD  SI,[0000]           ', #  buffer, go the slow way too
+  '0513 3B 36 FC 01        CMP  SI,[01FC]           ', #  "
+  '0517 77 3E              JA   0557                ', #  "
+  '0519 53                 PUSH BX                  ', # Factor the cassette block and its CRC into the CRC using the lookup table
+  '051A B7 08              MOV  BH,08               ', #  "
+  '051C B9 02 01           MOV  CX,0102             ', #  "
+  '051F AC                 LODSB                    ', #  "
+  '0520 30 F0              XOR  AL,DH               ', #  "
+  '0522 88 C3              MOV  BL,AL               ', #  "
+  '0524 8A 37              MOV  DH,[BX]             ', #  "
+  '0526 30 D6              XOR  DH,DL               ', #  "
+  '0528 8A 97 00 01        MOV  DL,[BX+0100]        ', #  "
+  '052C E2 F1              LOOP 051F                ', #  "
+  '052E 5B                 POP  BX                  ', #  "
+  '052F 81 EE 02 01        SUB  SI,0102             ', # Point SI back to the top of the cassette block
+  '0533 B9 00 01           MOV  CX,0100             ', # Copy the cassette block to the output buffer, or as much of it as was
+  '0536 39 CF              CMP  DI,CX               ', #  requested
+  '0538 73 02              JNB  053C                ', #  "
+  '053A 89 F9              MOV  CX,DI               ', #  "
+  '053C 29 CF              SUB  DI,CX               ', # Subtract bytes copied from bytes requested and add them to bytes read, and
+  '053E 01 CD              ADD  BP,CX               ', #  count them
+  '0540 01 0E D0 0B        ADD  [0BD0],CX           ', #  "
+  '0544 83 16 D2 0B 00     ADC  WORD PTR [0BD2],+00 ', #  "
+  '0549 87 FB              XCHG BX,DI               ', #  "
+  '054B F3                 REPZ                     ', #  "
+  '054C A4                 MOVSB                    ', #  "
+  '054D 87 FB              XCHG BX,DI               ', #  "
+  '054F B9 02 01           MOV  CX,0102             ', # Advance cassette past the cassette block and its CRC
+  '0552 E8 4D FF           CALL 04A2                ', #  "
+  '0555 F8                 CLC                      ', # Lower carry to indicate we did it
+  '0556 C3                 RET                      ', # Done
+  '0557 F9                 STC                      ', # Raise carry to signal that it'll have to be done the slow way
+  '0558 C3                 RET                      ', # Done
+  
+  # Subprogram: write a cassette block and its CRC to the track buffer all at once
+  # Pre: cassette block in track buffer and marked as changed, DX contains initial CRC, ES:BX points to input buffer, DI contains
+  #  number of bytes left to write, AL contains last byte written
+  # Post: if the cassette block and its CRC are entirely within the track buffer and end before the tape's last block, up to 256
+  #  bytes copied from input buffer (the rest filled with the last of them) and DI and BX updated accordingly, CRC written after
+  #  them, cassette advanced past them, and carry lowered; else carry raised and nothing changed; AX, CX, DX, SI trashed
+  
+  '0559 8B 0E 02 00        MOV  CX,[0002]           ', # If the cassette block and its CRC might run past the end of the tape (into
+  '055D 41                 INC  CX                  ', #  the next one, in a tape library), go the slow way, byte by byte, which
+  '055E 3B 0E FA 01        CMP  CX,[01FA]           ', #  stops at the end of the tape
+  '0562 73 F3              JNB  0557                ', #  "
+  '0564 8B 0E 06 00        MOV  CX,[0006]           ', # If the cassette block and its CRC don't fit in what's left of the track
+  '0568 03 0E 00 00        ADD  CX,[0000]           ', #  buffer, go the slow way too
+  '056C 3B 0E FC 01        CMP  CX,[01FC]           ', #  "
+  '0570 77 E5              JA   0557                ', #  "
+  '0572 89 DE              MOV  SI,BX               ', # Copy bytes to be written into the track buffer, up to a cassette block's
+  '0574 BB 00 01           MOV  BX,0100             ', #  worth
+  '0577 39 DF              CMP  DI,BX               ', #  "
+  '0579 73 02              JNB  057D                ', #  "
+  '057B 89 FB              MOV  BX,DI               ', #  "
+  '057D 29 DF              SUB  DI,BX               ', #  "
+  '057F 01 1E D4 0B        ADD  [0BD4],BX           ', # Count them as written
+  '0583 83 16 D6 0B 00     ADC  WORD PTR [0BD6],+00 ', #  "
+  '0588 57                 PUSH DI                  ', #  "
+  '0589 1E                 PUSH DS                  ', #  "
+  '058A 06                 PUSH ES                  ', #  "
+  '058B 06                 PUSH ES                  ', #  "
+  '058C 1F                 POP  DS                  ', #  "
+  '058D 0E                 PUSH CS                  ', #  "
+  '058E 07                 POP  ES                  ', #  "
+  '058F 89 CF              MOV  DI,CX               ', #  "
+  '0591 89 D9              MOV  CX,BX               ', #  "
+  '0593 F3                 REPZ                     ', #  "
+  '0594 A4                 MOVSB                    ', #  "
+  '0595 09 DB              OR   BX,BX               ', # Fill the rest of the cassette block with the last byte written, as the
+  '0597 74 03              JZ   059C                ', #  slow way does
+  '0599 8A 44 FF           MOV  AL,[SI-01]          ', #  "
+  '059C B9 00 01           MOV  CX,0100             ', #  "
+  '059F 29 D9              SUB  CX,BX               ', #  "
+  '05A1 F3                 REPZ                     ', #  "
+  '05A2 AA                 STOSB                    ', #  "
+  '05A3 07                 POP  ES                  ', #  "
+  '05A4 1F                 POP  DS                  ', #  "
+  '05A5 89 F3              MOV  BX,SI               ', # Advance the buffer pointer
+  '05A7 89 FE              MOV  SI,DI               ', # Point SI back to the top of the cassette block
+  '05A9 81 EE 00 01        SUB  SI,0100             ', #  "
+  '05AD 5F                 POP  DI                  ', #  "
+  '05AE 53                 PUSH BX                  ', # Factor the cassette block into the CRC using the lookup table
+  '05AF B7 08              MOV  BH,08               ', #  "
+  '05B1 B9 00 01           MOV  CX,0100             ', #  "
+  '05B4 AC                 LODSB                    ', #  "
+  '05B5 30 F0              XOR  AL,DH               ', #  "
+  '05B7 88 C3              MOV  BL,AL               ', #  "
+  '05B9 8A 37              MOV  DH,[BX]             ', #  "
+  '05BB 30 D6              XOR  DH,DL               ', #  "
+  '05BD 8A 97 00 01        MOV  DL,[BX+0100]        ', #  "
+  '05C1 E2 F1              LOOP 05B4                ', #  "
+  '05C3 5B                 POP  BX                  ', #  "
+  '05C4 F7 D2              NOT  DX                  ', # Ones' complement the CRC and write it after the cassette block, upper byte
+  '05C6 88 34              MOV  [SI],DH             ', #  first
+  '05C8 88 54 01           MOV  [SI+01],DL          ', #  "
+  '05CB B9 02 01           MOV  CX,0102             ', # Advance cassette past the cassette block and its CRC, if that took us into
+  '05CE E8 D1 FE           CALL 04A2                ', #  the next block, mark it as changed
+  '05D1 F7 06 00 00 FF FF  TEST WORD PTR [0000],FFFF', #  "
+  '05D7 74 03              JZ   05DC                ', #  "
+  '05D9 E8 90 FC           CALL 026C                ', #  "
+  '05DC F8                 CLC                      ', # Lower carry to indicate we did it
+  '05DD C3                 RET                      ', # Done
+  
+  # Subprogram (part of INT 15 handler): seek to a file in the tape directory
+  # Pre: AL is 0 and ES:BX points to the 8-byte (space-padded) name of a file, or AL is the 1-based number of an entry in the
+  #  tape directory
+  # Post: if file was found, position set to the beginning of its leader and AH set to 0 with carry clear, else AH set to 4 with
+  #  carry set
+  
+  '05DE 51                 PUSH CX                  ', # Preserve the registers that we will trash
+  '05DF 56                 PUSH SI                  ', #  "
+  '05E0 57                 PUSH DI                  ', #  "
+  '05E1 BE 00 0A           MOV  SI,0A00             ', # Point SI to the first entry in the tape directory and CX to the number of
+  '05E4 B9 1C 00           MOV  CX,001C             ', #  entries
+  '05E7 08 C0              OR   AL,AL               ', # If AL is 0, look for the file by name
+  '05E9 74 15              JZ   0600                ', #  "
+  '05EB FE C8              DEC  AL                  ', # Otherwise, point SI to the entry AL selects, if there is such an entry
+  '05ED 38 C8              CMP  AL,CL               ', #  "
+  '05EF 73 26              JNB  0617                ', #  "
+  '05F1 B1 04              MOV  CL,04               ', #  "
+  '05F3 30 E4              XOR  AH,AH               ', #  "
+  '05F5 D3 E0              SHL  AX,CL               ', #  "
+  '05F7 01 C6              ADD  SI,AX               ', #  "
+  '05F9 80 3C 00           CMP  BYTE PTR [SI],00    ', #  "
+  '05FC 74 19              JZ   0617                ', #  "
+  '05FE EB 26              JMP  0626                ', #  "
+  '0600 80 3C 00           CMP  BYTE PTR [SI],00    ', # If we've reached the end of the tape directory, the file isn't there
+  '0603 74 12              JZ   0617                ', #  "
+  '0605 51                 PUSH CX                  ', # If the name in this entry matches, we've found the file
+  '0606 56                 PUSH SI                  ', #  "
+  '0607 89 DF              MOV  DI,BX               ', #  "
+  '0609 B9 08 00           MOV  CX,0008             ', #  "
+  '060C F3                 REPZ                     ', #  "
+  '060D A6                 CMPSB                    ', #  "
+  '060E 5E                 POP  SI                  ', #  "
+  '060F 59                 POP  CX                  ', #  "
+  '0610 74 14              JZ   0626                ', #  "
+  '0612 83 C6 10           ADD  SI,+10              ', # Otherwise, move on to the next entry
+  '0615 E2 E9              LOOP 0600                ', #  "
+  '0617 B4 04              MOV  AH,04               ', # Return "data not found" error code, count the error, and set carry to
+  '0619 83 06 E8 0B 01     ADD  WORD PTR [0BE8],+01 ', #  indicate an error
+  '061E 83 16 EA 0B 00     ADC  WORD PTR [0BEA],+00 ', #  "
+  '0623 F9                 STC                      ', #  "
+  '0624 EB 19              JMP  063F                ', #  "
+  '0626 8B 44 0C           MOV  AX,[SI+0C]          ', # Load the block where the file starts into the track buffer
+  '0629 A3 02 00           MOV  [0002],AX           ', #  "
+  '062C C7 06 00 00 00 00  MOV  WORD PTR [0000],0000', #  "
+  '0632 E8 93 FB           CALL 01C8                ', #  "
+  '0635 72 E0              JB   0617                ', #  "
+  '0637 8B 44 0E           MOV  AX,[SI+0E]          ', # Set offset to where the file starts within the block
+  '063A A3 00 00           MOV  [0000],AX           ', #  "
+  '063D 30 E4              XOR  AH,AH               ', # Clear carry and set AH to 0 for no error
+  '063F 5F                 POP  DI                  ', # Restore registers
+  '0640 5E                 POP  SI                  ', #  "
+  '0641 59                 POP  CX                  ', #  "
+  '0642 E9 EF FC           JMP  0334                ', # Done
+  
+  # Subprogram: count the bytes read since the read handler began looking for a leader as leader bytes skipped
+  # Pre: position where the read handler began looking for a leader in BP (block) and SI (offset)
+  # Post: leader bytes skipped counted; AX, CX, DX trashed
+  
+  '0645 A1 02 00           MOV  AX,[0002]           ', # Get the distance from there to here in bytes
+  '0648 29 E8              SUB  AX,BP               ', #  "
+  '064A B9 00 02           MOV  CX,0200             ', #  "
+  '064D F7 E1              MUL  CX                  ', #  "
+  '064F 03 06 00 00        ADD  AX,[0000]           ', #  "
+  '0653 83 D2 00           ADC  DX,+00              ', #  "
+  '0656 29 F0              SUB  AX,SI               ', #  "
+  '0658 83 DA 00           SBB  DX,+00              ', #  "
+  '065B 01 06 D8 0B        ADD  [0BD8],AX           ', # Count it
+  '065F 11 16 DA 0B        ADC  [0BDA],DX           ', #  "
+  '0663 C3                 RET                      ', # Done
+  
+  # Subprogram: call INT 13 to read or write sectors, counting the call and the sectors
+  # Pre: registers set up for an INT 13 call with AH = 02 (read) or 03 (write)
+  # Post: sectors read or written and counted, carry set on error; AX trashed
+  
+  '0664 50                 PUSH AX                  ', # Keep the function and number of sectors for counting
+  '0665 CD 13              INT  13                  ', # Call the BIOS, pass carry on if that failed
+  '0667 58                 POP  AX                  ', #  "
+  '0668 72 1E              JB   0688                ', #  "
+  '066A 53                 PUSH BX                  ', # Point BX to the counters for reads or writes, as appropriate
+  '066B BB C0 0B           MOV  BX,0BC0             ', #  "
+  '066E 80 FC 02           CMP  AH,02               ', #  "
+  '0671 74 03              JZ   0676                ', #  "
+  '0673 BB C8 0B           MOV  BX,0BC8             ', #  "
+  '0676 83 07 01           ADD  WORD PTR [BX],+01   ', # Count the call
+  '0679 83 57 02 00        ADC  WORD PTR [BX+02],+00', #  "
+  '067D 30 E4              XOR  AH,AH               ', # Count the sectors
+  '067F 01 47 04           ADD  [BX+04],AX          ', #  "
+  '0682 83 57 06 00        ADC  WORD PTR [BX+06],+00', #  "
+  '0686 5B                 POP  BX                  ', # Restore BX
+  '0687 F8                 CLC                      ', # Clear carry to indicate no error
+  '0688 C3                 RET                      ', # Done
+  
+  # Subprogram (part of INT 15 handler): turn off the motor
+  # Post: if the tape directory's flags say to, counters written to disk along with the tape directory; AH set to 0 with carry
+  #  clear whether or not that worked, since the counters are only for diagnosis
+  
+  '0689 F6 06 F0 0B 02     TEST BYTE PTR [0BF0],02  ', # If the counters aren't to be saved, we're done (TEST clears carry)
+  '068E 74 1D              JZ   06AD                ', #  "
+  '0690 50                 PUSH AX                  ', # Preserve the registers that we will trash
+  '0691 53                 PUSH BX                  ', #  "
+  '0692 51                 PUSH CX                  ', #  "
+  '0693 52                 PUSH DX                  ', #  "
+  '0694 06                 PUSH ES                  ', #  "
+  '0695 B9 44 00           MOV  CX,0044             ', # Write the tape directory sector, which holds the counters, back to disk
+  '0698 E8 04 FB           CALL 019F                ', #  "
+  '069B 72 0B              JB   06A8                ', #  "
+  '069D 0E                 PUSH CS                  ', #  "
+  '069E 07                 POP  ES                  ', #  "
+  '069F BB 00 0A           MOV  BX,0A00             ', #  "
+  '06A2 B8 01 03           MOV  AX,0301             ', #  "
+  '06A5 E8 BC FF           CALL 0664                ', #  "
+  '06A8 07                 POP  ES                  ', # Restore registers
+  '06A9 5A                 POP  DX                  ', #  "
+  '06AA 59                 POP  CX                  ', #  "
+  '06AB 5B                 POP  BX                  ', #  "
+  '06AC 58                 POP  AX                  ', #  "
+  '06AD 30 E4              XOR  AH,AH               ', # Clear carry and set AH to 0 for no error
+  '06AF E9 82 FC           JMP  0334                ', # Done
+  
+  # Subprogram (part of INT 15 handler): select a tape in the tape library
+  # Pre: AL is the 1-based number of the tape to select, or 0 to get the number of the tape selected
+  # Post: if AL was 0, AL set to the number of the tape selected (0 if none); else if there is such a tape, it's selected and
+  #  rewound; AH set to 0 with carry clear on success, else AH set to 4 with carry set
+  
+  '06B2 08 C0              OR   AL,AL               ', # If AL is 0, return the number of the tape selected
+  '06B4 75 08              JNZ  06BE                ', #  "
+  '06B6 A0 0C 00           MOV  AL,[000C]           ', #  "
+  '06B9 30 E4              XOR  AH,AH               ', #  "
+  '06BB E9 76 FC           JMP  0334                ', #  "
+  '06BE A2 0D 00           MOV  [000D],AL           ', # Ask for the tape and switch to it
+  '06C1 E8 09 00           CALL 06CD                ', #  "
+  '06C4 B4 00              MOV  AH,00               ', # Return 0 if that worked, else "data not found" error code, with carry as
+  '06C6 73 02              JNB  06CA                ', #  switch left it
+  '06C8 B4 04              MOV  AH,04               ', #  "
+  '06CA E9 67 FC           JMP  0334                ', # Done
+  
+  # Subprogram: switch to the tape asked for in the tape library
+  # Pre: 1-based number of the tape asked for stored in [000D]
+  # Post: request cleared; if the diskette is a tape library with such a tape, changed blocks in the track buffer written back,
+  #  tape's directory loaded, block where it begins stored in [000E], number of blocks on it stored in the geometry table, its
+  #  number stored in [000C], position set to its beginning, and carry lowered; else carry raised and tape and position left be
+  
+  '06CD 50                 PUSH AX                  ', # Preserve the registers that we will trash
+  '06CE 53                 PUSH BX                  ', #  "
+  '06CF 51                 PUSH CX                  ', #  "
+  '06D0 52                 PUSH DX                  ', #  "
+  '06D1 56                 PUSH SI                  ', #  "
+  '06D2 57                 PUSH DI                  ', #  "
+  '06D3 06                 PUSH ES                  ', #  "
+  '06D4 A0 0D 00           MOV  AL,[000D]           ', # Get the number of the tape asked for and clear the request
+  '06D7 30 E4              XOR  AH,AH               ', #  "
+  '06D9 89 C6              MOV  SI,AX               ', #  "
+  '06DB 88 26 0D 00        MOV  [000D],AH           ', #  "
+  '06DF F6 06 F0 0B 04     TEST BYTE PTR [0BF0],04  ', # If the diskette isn't a tape library, there's nothing to switch to
+  '06E4 74 5E              JZ   0744                ', #  "
+  '06E6 E8 42 FB           CALL 022B                ', # Write back the current tape's changed blocks, pass carry on if that failed
+  '06E9 72 59              JB   0744                ', #  "
+  '06EB 0E                 PUSH CS                  ', # Read the tape table, which is the first block after the tape directory,
+  '06EC 07                 POP  ES                  ', #  into scratch space between the tape directory and the track buffer, so
+  '06ED B9 45 00           MOV  CX,0045             ', #  the track buffer is left be if this fails
+  '06F0 BB 00 0C           MOV  BX,0C00             ', #  "
+  '06F3 E8 51 00           CALL 0747                ', #  "
+  '06F6 72 4C              JB   0744                ', #  "
+  '06F8 4E                 DEC  SI                  ', # If there's no such tape in the table, fail
+  '06F9 3B 36 00 0C        CMP  SI,[0C00]           ', #  "
+  '06FD 73 45              JNB  0744                ', #  "
+  '06FF 46                 INC  SI                  ', # Point SI to the tape's entry in the table
+  '0700 89 F7              MOV  DI,SI               ', #  "
+  '0702 D1 E6              SHL  SI,1                ', #  "
+  '0704 D1 E6              SHL  SI,1                ', #  "
+  '0706 81 C6 00 0C        ADD  SI,0C00             ', #  "
+  '070A 8B 0C              MOV  CX,[SI]             ', # Read the tape's directory, which is its first block, into scratch space
+  '070C 83 C1 45           ADD  CX,+45              ', #  after the tape table
+  '070F BB 00 0E           MOV  BX,0E00             ', #  "
+  '0712 51                 PUSH CX                  ', #  "
+  '0713 E8 31 00           CALL 0747                ', #  "
+  '0716 59                 POP  CX                  ', #  "
+  '0717 72 2B              JB   0744                ', #  "
+  '0719 41                 INC  CX                  ', # Make the tape's blocks, which follow its directory, the cassette
+  '071A 89 0E 0E 00        MOV  [000E],CX           ', #  "
+  '071E 8B 44 02           MOV  AX,[SI+02]          ', #  "
+  '0721 A3 FA 01           MOV  [01FA],AX           ', #  "
+  '0724 89 F8              MOV  AX,DI               ', #  "
+  '0726 A2 0C 00           MOV  [000C],AL           ', #  "
+  '0729 31 C0              XOR  AX,AX               ', # Rewind to the beginning of the tape (the track buffer holds diskette
+  '072B A3 00 00           MOV  [0000],AX           ', #  blocks, so whatever is in it is still good); XOR ensures that carry flag
+  '072E A3 02 00           MOV  [0002],AX           ', #  is low to indicate no error
+  '0731 BE 00 0E           MOV  SI,0E00             ', # Copy the tape's directory entries into the tape directory, leaving the
+  '0734 BF 00 0A           MOV  DI,0A00             ', #  counters and flags be
+  '0737 B9 E0 00           MOV  CX,00E0             ', #  "
+  '073A F3                 REPZ                     ', #  "
+  '073B A5                 MOVSW                    ', #  "
+  '073C 07                 POP  ES                  ', # Restore trashed registers
+  '073D 5F                 POP  DI                  ', #  "
+  '073E 5E                 POP  SI                  ', #  "
+  '073F 5A                 POP  DX                  ', #  "
+  '0740 59                 POP  CX                  ', #  "
+  '0741 5B                 POP  BX                  ', #  "
+  '0742 58                 POP  AX                  ', #  "
+  '0743 C3                 RET                      ', # Done
+  '0744 F9                 STC                      ', # Raise carry to signal error
+  '0745 EB F5              JMP  073C                ', # Rejoin above
+  
+  # Subprogram: read a block from disk
+  # Pre: CX contains the linear block number, ES:BX points to where to read it
+  # Post: block read, carry set on error; AX, CX, DX trashed
+  
+  '0747 E8 55 FA           CALL 019F                ', # Read the block, pass carry on if that failed
+  '074A 72 06              JB   0752                ', #  "
+  '074C B8 01 02           MOV  AX,0201             ', #  "
+  '074F E8 12 FF           CALL 0664                ', #  "
+  '0752 C3                 RET                      ', # Done
+  
 )
 CASSBOX_BIN = bytes(int(i, 16) for i in ' '.join(line[5:22] for line in CASSBOX_ASM).split())
+CASSBOX_BIN += bytes(-len(CASSBOX_BIN) % 512)  # CassBox occupies whole sectors
+
+DiskGeometry = collections.namedtuple('DiskGeometry', 'sectors_per_track heads tracks')
+DISK_GEOMETRIES = {
+  '320K': DiskGeometry(8, 2, 40),
+  '360K': DiskGeometry(9, 2, 40),
+  '720K': DiskGeometry(9, 2, 80),
+  '1.2M': DiskGeometry(15, 2, 80),
+  '1.44M': DiskGeometry(18, 2, 80),
+}
+DEFAULT_GEOMETRY = '320K'
+CASSBOX_GEOMETRY = struct.Struct('<HHHHH')  # sectors per track, heads, blocks on diskette, blocks on cassette, and highest
+CASSBOX_GEOMETRY_OFFSET = 0x1F4             #  address in track buffer where a cassette block and its CRC fit
+TRACK_BUFFER_ADDRESS = 0x1000
+CASSBOX_SEGMENT = 0x9000  # where CassBox keeps itself in memory
+TAPE_DIRECTORY_ADDRESS = 0x0A00  # where in CassBox's segment the handler keeps the tape directory
 
 DISK_IMAGE_SIZE = 327680
 BASIC_ROM_SIZE = 8192
 BASIC_ROM_NUMBER_OF_CHIPS = 4
-CASSETTE_SIZE = DISK_IMAGE_SIZE - (len(CASSBOX_BIN) + BASIC_ROM_SIZE * BASIC_ROM_NUMBER_OF_CHIPS)
+TAPE_DIRECTORY_SIZE = 512
+TAPE_DIRECTORY_POSITION = len(CASSBOX_BIN) + BASIC_ROM_SIZE * BASIC_ROM_NUMBER_OF_CHIPS
+CASSETTE_POSITION = TAPE_DIRECTORY_POSITION + TAPE_DIRECTORY_SIZE
+CASSETTE_SIZE = DISK_IMAGE_SIZE - CASSETTE_POSITION
 
 BASIC10_SHA256_SUM = '2452b03b4b724b5b81e8cc367809c521144f5fe4e0425caee42ac71240b9b102'
 BASIC11_SHA256_SUM = '3033d1a54c99d7e2aa1fc7c8c2e51a56ae1b61bf4e70e8aa580f43c43e37a63e'
@@ -302,6 +885,50 @@ BASIC10_MAME_FILES = ('5700019.u29', '5700027.u30', '5700035.u31', '5700043.u32'
 BASIC11_MAME_FILES = ('5000019.u29', '5000021.u30', '5000022.u31', '5000023.u32')
 BASIC_MAME_FILE_SETS_AND_SHA256_SUMS = ((BASIC10_MAME_FILES, BASIC10_SHA256_SUM), (BASIC11_MAME_FILES, BASIC11_SHA256_SUM))
 
+MAME_INDEX_VERSION = 1
+IMAGE_CACHE_VERSION = 3  # bump when images built from the same inputs would come out differently
+FICLONE = 0x40049409  # Linux ioctl that makes one file share another's data (a reflink)
+
+CASSETTE_LEADER = b'\xFF' * 128  # read handler wants at least this many 0xFFs before the sync bit
+CASSETTE_SYNC = b'\xFE\x16'  # sync bit and sync byte
+CASSETTE_LEADER_TOKEN = b'\xFD'  # on a compact tape, stands in for a whole leader (and the trailer before it)
+CASSETTE_WRITE_LEADER = b'\xFF' * 318  # leader the write handler puts before every record
+CASSETTE_BLOCK_SIZE = 256
+CASSETTE_CRC_SIZE = 2
+CASSETTE_CRC_RESIDUE = 0x1D0F
+CASSETTE_TRAILER = b'\xFF' * 4  # trailer the write handler puts after every record
+
+WAV_ONE_BIT_CYCLE = 0.001  # seconds per cycle of a 1 bit on a real cassette; a 0 bit's cycle takes half as long
+WAV_LEADER_BITS = 256  # fewest 1 bits before a sync bit that count as a leader in a recording
+
+BASIC_HEADER_SIGNATURE = 0xA5
+BASIC_FILE_TYPES = {0x00: 'D', 0x01: 'M', 0x20: 'P', 0x40: 'A', 0x80: 'B', 0xA0: 'P'}
+BASIC_FILE_EXTENSIONS = {'D': '.dat', 'M': '.bin', 'P': '.bas', 'A': '.asc', 'B': '.bas'}
+BASIC_FILE_TYPE_CODES = {'D': 0x00, 'M': 0x01, 'P': 0xA0, 'A': 0x40, 'B': 0x80}  # what BASIC writes in headers
+BASIC_FILE_TYPES_BY_EXTENSION = {'.dat': 'D', '.bin': 'M', '.asc': 'A', '.bas': 'B'}  # protected files can't be told apart
+BASIC_HEADER = struct.Struct('<B8sBHHH')  # signature, name, type, length, segment and offset of a memory image
+BASIC_RECORD_DATA_SIZE = CASSETTE_BLOCK_SIZE - 1  # bytes in each record of an ASCII or data file, after its length byte
+
+TAPE_DIRECTORY_ENTRY = struct.Struct('<8ssxHHH')  # name, type, length, block and offset where leader begins
+TAPE_DIRECTORY_FLAGS = TAPE_DIRECTORY_SIZE - TAPE_DIRECTORY_ENTRY.size  # last entry's space holds flags instead
+TAPE_FLAG_COMPACT = 0x01  # leaders are stored as CASSETTE_LEADER_TOKEN
+TAPE_FLAG_STATS = 0x02  # handler writes its counters back to the image whenever the motor is turned off
+TAPE_FLAG_LIBRARY = 0x04  # cassette holds a tape library rather than a tape
+TAPE_LIBRARY_ENTRY = struct.Struct('<HH')  # block where a tape (its directory, then its data) begins, blocks of data on it
+TAPE_LIBRARY_TAPES = TAPE_DIRECTORY_SIZE // TAPE_LIBRARY_ENTRY.size - 1  # first entry's space holds the number of tapes
+
+HandlerCounters = collections.namedtuple('HandlerCounters', 'int13_reads sectors_read int13_writes sectors_written'
+                                                            ' bytes_read bytes_written leader_bytes_skipped sync_restarts'
+                                                            ' crc_errors bad_signal_errors not_found_errors'
+                                                            ' bad_function_errors')
+HANDLER_COUNTERS = struct.Struct('<12L')  # kept by the handler in the tape directory, just before the flags
+TAPE_DIRECTORY_COUNTERS = TAPE_DIRECTORY_FLAGS - HANDLER_COUNTERS.size
+TAPE_DIRECTORY_ENTRIES = TAPE_DIRECTORY_COUNTERS // TAPE_DIRECTORY_ENTRY.size
+HANDLER_COUNTER_LABELS = ('INT 13 reads', 'sectors read', 'INT 13 writes', 'sectors written', 'bytes read', 'bytes written',
+                          'leader bytes skipped', 'sync restarts', 'CRC errors (01)', 'bad signal errors (02)',
+                          'not found errors (04)', 'bad function errors (80)')
+MEMORY_DUMP_SIZE = 0xA0000  # a memory dump at least this big starts at 0000:0000, smaller ones at CASSBOX_SEGMENT:0000
+
 
 def read_basic_rom_file(filepath, number_of_chips=1):
   '''Read a BASIC ROM file and complain if it's the wrong size.'''
@@ -312,51 +939,1065 @@ def read_basic_rom_file(filepath, number_of_chips=1):
     return data
 
 
-def read_cassette_file(filepath):
-  '''Read a cassette file and pad it to the correct size, complain if it's over.'''
+def disk_image_size(geometry):
+  '''Return the size of a diskette image of the given geometry.'''
+  return geometry.sectors_per_track * geometry.heads * geometry.tracks * 512
+
+
+def cassette_size(geometry):
+  '''Return the size of the cassette on a diskette image of the given geometry.'''
+  return disk_image_size(geometry) - CASSETTE_POSITION
+
+
+def make_cassbox_bin(geometry):
+  '''Return CASSBOX_BIN with the diskette geometry at the end of its MBR filled in for the given geometry.'''
+  data = bytearray(CASSBOX_BIN)
+  CASSBOX_GEOMETRY.pack_into(data, CASSBOX_GEOMETRY_OFFSET, geometry.sectors_per_track, geometry.heads,
+                             disk_image_size(geometry) // 512, cassette_size(geometry) // 512,
+                             TRACK_BUFFER_ADDRESS + geometry.sectors_per_track * 512 - CASSETTE_BLOCK_SIZE - CASSETTE_CRC_SIZE)
+  return bytes(data)
+
+
+def _read_cassette(fp, view, compact, name):
+  '''Read a cassette file into a buffer (compacting its leaders if asked to), return its length, complain if it's over.'''
+  if compact:
+    data = compact_cassette_data(fp.read())
+    if len(data) > len(view):
+      raise ValueError(f'cassette file {name} is longer than the maximum size of {len(view)} bytes even when compacted')
+    view[:len(data)] = data
+    return len(data)
+  length = 0
+  while length < len(view):
+    count = fp.readinto(view[length:])
+    if not count: break
+    length += count
+  if fp.read(1): raise ValueError(f'cassette file {name} is longer than the maximum size of {len(view)} bytes')
+  return length
+
+
+def read_cassette_file(filepath, compact=False, size=CASSETTE_SIZE):
+  '''Read a cassette file (compacting its leaders if asked to) and pad it to the given size, complain if it's over.'''
+  data = bytearray(size)
   with open(filepath, 'rb') as fp:
-    data = fp.read(CASSETTE_SIZE)
-    if fp.read(1):
-      raise ValueError(f'cassette file {filepath} is longer than the maximum size of {CASSETTE_SIZE} bytes')
-  if len(data) < CASSETTE_SIZE:
-    data = b''.join((data, bytes(CASSETTE_SIZE - len(data))))
+    _read_cassette(fp, memoryview(data), compact, filepath)
   return data
 
 
-def get_mame_basic_rom(directory):
-  '''Walk a MAME directory and extract the latest correct concatenated BASIC ROM.'''
-  basic_roms = {k: None for k in BASIC_MAME_FILE_SETS_AND_SHA256_SUMS}
-  for path, _, files in os.walk(directory):
-    for file_set, sha256sum in BASIC_MAME_FILE_SETS_AND_SHA256_SUMS:
-      if all(os.path.exists(os.path.join(path, rom_file)) for rom_file in file_set):
+def read_mame_rom_set(container, file_set):
+  '''Read a set of BASIC ROM chips from a directory or zip file and concatenate them, return None if they can't be read.'''
+  try:
+    if os.path.isdir(container):
+      return b''.join(read_basic_rom_file(os.path.join(container, rom_file)) for rom_file in file_set)
+    with zipfile.ZipFile(container) as zip_file:
+      members = {os.path.basename(i.filename).lower(): i for i in zip_file.infolist()}
+      if any(members[rom_file].file_size != BASIC_ROM_SIZE for rom_file in file_set): return None
+      return b''.join(zip_file.read(members[rom_file]) for rom_file in file_set)
+  except (KeyError, OSError, ValueError, zipfile.BadZipFile):
+    return None
+
+
+def find_mame_rom_sets(container):
+  '''Return a (file set, SHA-256 sum, data) tuple for every correct BASIC ROM set in a directory or zip file.'''
+  found = []
+  for file_set, sha256sum in BASIC_MAME_FILE_SETS_AND_SHA256_SUMS:
+    data = read_mame_rom_set(container, file_set)
+    if data is not None and hashlib.sha256(data).hexdigest() == sha256sum: found.append((file_set, sha256sum, data))
+  return found
+
+
+def default_mame_index_path():
+  '''Return the default location of the MAME ROM discovery index.'''
+  cache_dir = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+  return os.path.join(cache_dir, 'cassbox', 'mame_index.json')
+
+
+def load_mame_index(filepath):
+  '''Load a MAME ROM discovery index, return an empty one if there isn't one or it can't be understood.'''
+  if filepath:
+    try:
+      with open(filepath, 'r') as fp:
+        index = json.load(fp)
+      if index.get('version') == MAME_INDEX_VERSION: return index
+    except (OSError, ValueError, AttributeError):
+      pass
+  return {'version': MAME_INDEX_VERSION, 'roots': {}, 'archives': {}}
+
+
+def save_mame_index(filepath, index):
+  '''Save a MAME ROM discovery index, warn but carry on if it can't be written.'''
+  try:
+    os.makedirs(os.path.dirname(os.path.abspath(filepath)), exist_ok=True)
+    with open(f'{filepath}.tmp', 'w') as fp:
+      json.dump(index, fp)
+    os.replace(f'{filepath}.tmp', filepath)
+  except OSError as e:
+    sys.stderr.write(f"warning, couldn't save MAME ROM index: {str(e)}\n")
+
+
+def _stat_key(filepath):
+  '''Return the size and modification time of a file, which together identify a version of it in the MAME ROM index.'''
+  stat = os.stat(filepath)
+  return [stat.st_size, stat.st_mtime_ns]
+
+
+def _get_indexed_mame_basic_roms(root, index):
+  '''Reload the BASIC ROM sets the index remembers for a MAME directory, return None if any have changed or gone missing.'''
+  basic_roms = {}
+  for container, key, sha256sum in index['roots'].get(root, ()):
+    try:
+      if _stat_key(container) != key: return None
+    except OSError:
+      return None
+    found = {k: (file_set, data) for file_set, k, data in find_mame_rom_sets(container)}
+    if sha256sum not in found: return None
+    file_set, data = found[sha256sum]
+    basic_roms[(file_set, sha256sum)] = (container, data)
+  return basic_roms or None
+
+
+def _walk_mame_basic_roms(root, index):
+  '''Walk a MAME directory and its zip files for BASIC ROM sets, hashing candidates in parallel and updating the index.'''
+  basic_roms = {}
+  archives = {}
+  best = BASIC_MAME_FILE_SETS_AND_SHA256_SUMS[-1]
+  with concurrent.futures.ThreadPoolExecutor() as executor:
+    futures = {}
+    for path, _, files in os.walk(root):
+      files = set(files)
+      if any(all(rom_file in files for rom_file in file_set) for file_set, _ in BASIC_MAME_FILE_SETS_AND_SHA256_SUMS):
+        futures[executor.submit(find_mame_rom_sets, path)] = path
+      for filename in files:
+        if not filename.lower().endswith('.zip'): continue
+        archive = os.path.join(path, filename)
         try:
-          data = b''.join(read_basic_rom_file(os.path.join(path, rom_file)) for rom_file in file_set)
-        except ValueError as e:
+          key = _stat_key(archive)
+        except OSError:
           continue
-        if hashlib.sha256(data).hexdigest() == sha256sum: basic_roms[(file_set, sha256sum)] = data
-        sys.stderr.write(f'found valid rom set {file_set} in {path}\n')
-    if basic_roms[BASIC_MAME_FILE_SETS_AND_SHA256_SUMS[-1]] is not None: break
+        archives[archive] = {'key': key, 'sets': []}
+        indexed = index['archives'].get(archive)
+        if indexed and indexed['key'] == key and not indexed['sets']: continue  # unchanged since we last found nothing in it
+        futures[executor.submit(find_mame_rom_sets, archive)] = archive
+      for future in [i for i in futures if i.done()]:
+        for file_set, sha256sum, data in future.result():
+          basic_roms[(file_set, sha256sum)] = (futures[future], data)
+      if best in basic_roms: break
+    for future, container in futures.items():
+      for file_set, sha256sum, data in future.result():
+        basic_roms[(file_set, sha256sum)] = (container, data)
+        if container in archives: archives[container]['sets'].append(sha256sum)
+  index['archives'].update(archives)
+  index['roots'][root] = [[container, _stat_key(container), sha256sum]
+                          for (_, sha256sum), (container, _) in basic_roms.items()]
+  return basic_roms
+
+
+def get_mame_basic_rom(directory, index_path=None, rescan=False):
+  '''Find the latest correct concatenated BASIC ROM in a MAME directory, loose or zipped, using an on-disk index if given.'''
+  root = os.path.abspath(directory)
+  index = load_mame_index(index_path)
+  basic_roms = None if rescan else _get_indexed_mame_basic_roms(root, index)
+  if basic_roms is None:
+    basic_roms = _walk_mame_basic_roms(root, index)
+    if index_path: save_mame_index(index_path, index)
+  for (file_set, _), (container, _) in basic_roms.items():
+    sys.stderr.write(f'found valid rom set {file_set} in {container}\n')
+  for file_set, sha256sum in reversed(BASIC_MAME_FILE_SETS_AND_SHA256_SUMS):
+    if (file_set, sha256sum) not in basic_roms: continue
+    sys.stderr.write(f'using rom set {file_set}\n')
+    return basic_roms[(file_set, sha256sum)][1]
+  return None
+
+
+def find_disk_image_geometry(image):
+  '''Return the geometry of a CassBox diskette image (in any object that can be sliced like bytes), or None if it's not one.'''
+  for geometry in DISK_GEOMETRIES.values():
+    if len(image) == disk_image_size(geometry) and image[:len(CASSBOX_BIN)] == make_cassbox_bin(geometry): return geometry
+  return None
+
+
+def read_tape_library(image):
+  '''Return the block where each tape in a CassBox diskette image's tape library begins and the number of blocks of data on
+  it, or None if the image holds a single tape.
+  '''
+  if not image[TAPE_DIRECTORY_POSITION + TAPE_DIRECTORY_FLAGS] & TAPE_FLAG_LIBRARY: return None
+  table = image[CASSETTE_POSITION:CASSETTE_POSITION + TAPE_DIRECTORY_SIZE]
+  count = min(TAPE_LIBRARY_ENTRY.unpack_from(table)[0], TAPE_LIBRARY_TAPES)
+  return [TAPE_LIBRARY_ENTRY.unpack_from(table, i * TAPE_LIBRARY_ENTRY.size) for i in range(1, count + 1)]
+
+
+def find_tape(image, tape=1, name='image'):
+  '''Return the positions in a CassBox diskette image of the tape directory for one of its tapes (1 if it holds a single
+  tape), and of the beginning and end of the tape's data.
+  '''
+  library = read_tape_library(image)
+  if library is None:
+    if tape != 1: raise ValueError(f'{name} is not a tape library, it holds a single tape')
+    return TAPE_DIRECTORY_POSITION, CASSETTE_POSITION, len(image)
+  if not 1 <= tape <= len(library): raise ValueError(f'{name} has no tape {tape}, it has {len(library)}')
+  block, blocks = library[tape - 1]
+  directory = CASSETTE_POSITION + block * TAPE_DIRECTORY_SIZE
+  return directory, directory + TAPE_DIRECTORY_SIZE, directory + TAPE_DIRECTORY_SIZE + blocks * 512
+
+
+def read_cassette_tapes(filepath):
+  '''Read the cassette data of every tape out of a CassBox diskette image, or all of a file that isn't one (e.g. a cassette
+  file), return a list of them and whether their leaders are compacted.
+  '''
+  with open(filepath, 'rb') as fp:
+    data = fp.read()
+  if find_disk_image_geometry(data) is None: return [data], False
+  compact = bool(data[TAPE_DIRECTORY_POSITION + TAPE_DIRECTORY_FLAGS] & TAPE_FLAG_COMPACT)
+  tapes = []
+  for tape in range(1, len(read_tape_library(data) or (None,)) + 1):
+    _, start, end = find_tape(data, tape, filepath)
+    tapes.append(data[start:end])
+  return tapes, compact
+
+
+def read_cassette_data(filepath, tape=1):
+  '''Read the cassette data of a tape out of a CassBox diskette image, or all of a file that isn't one (e.g. a cassette file),
+  return it and whether its leaders are compacted.
+  '''
+  tapes, compact = read_cassette_tapes(filepath)
+  if not 1 <= tape <= len(tapes): raise ValueError(f'{filepath} has no tape {tape}, it has {len(tapes)}')
+  return tapes[tape - 1], compact
+
+
+def read_handler_counters(filepath):
+  '''Read the cassette handler's counters out of a CassBox diskette image (as last saved to it) or a dump of memory from a
+  machine running CassBox (all of it from 0000:0000, or from 9000:0000 on), return them and whether they come from an image
+  that has them saved to it.
+  '''
+  with open(filepath, 'rb') as fp:
+    data = fp.read()
+  if find_disk_image_geometry(data) is not None:
+    directory = data[TAPE_DIRECTORY_POSITION:CASSETTE_POSITION]
+    saved = bool(directory[TAPE_DIRECTORY_FLAGS] & TAPE_FLAG_STATS)
+  else:
+    base = CASSBOX_SEGMENT << 4 if len(data) >= MEMORY_DUMP_SIZE else 0
+    if data[base + 512:base + len(CASSBOX_BIN)] != CASSBOX_BIN[512:]:
+      raise ValueError(f'{filepath} is neither a CassBox diskette image nor a memory dump with CassBox in it')
+    directory = data[base + TAPE_DIRECTORY_ADDRESS:base + TAPE_DIRECTORY_ADDRESS + TAPE_DIRECTORY_SIZE]
+    saved = True
+  return HandlerCounters._make(HANDLER_COUNTERS.unpack_from(directory, TAPE_DIRECTORY_COUNTERS)), saved
+
+
+_cassette_leader = re.compile(re.escape(CASSETTE_LEADER))  # a regex rather than find() so memoryviews can be searched too
+_cassette_leader_tail = re.compile(b'\xFF*')
+_cassette_compact_leader = re.compile(b'|'.join(re.escape(i) for i in (CASSETTE_LEADER, CASSETTE_LEADER_TOKEN)))
+
+
+def find_cassette_record(data, pos=0, compact=False):
+  '''Find the next record in cassette data the way the read handler does, return positions of its leader and first block.'''
+  while True:
+    if compact:
+      match = _cassette_compact_leader.search(data, pos)
+      if match is None: return None, None
+      leader_pos, pos = match.span()
+    else:
+      match = _cassette_leader.search(data, pos)
+      if match is None: return None, None
+      leader_pos, pos = match.span()
+    pos = _cassette_leader_tail.match(data, pos).end()
+    if data[pos:pos + 1] != CASSETTE_SYNC[:1]:
+      pos += 1  # other byte values mean starting over after them
+    elif data[pos + 1:pos + 2] != CASSETTE_SYNC[1:]:
+      pos += 2  # sync bit without sync byte means starting over after the byte that should have been the sync byte
+    else:
+      return leader_pos, pos + len(CASSETTE_SYNC)
+
+
+def read_cassette_blocks(data, pos, length):
+  '''Read the blocks holding length bytes from the given position, return the bytes, the position after them, and CRC status.'''
+  chunks = []
+  crc_ok = True
+  for _ in range(max(1, -(-length // CASSETTE_BLOCK_SIZE))):
+    block = data[pos:pos + CASSETTE_BLOCK_SIZE + CASSETTE_CRC_SIZE]
+    if len(block) != CASSETTE_BLOCK_SIZE + CASSETTE_CRC_SIZE: raise ValueError('cassette data ends in the middle of a block')
+    if binascii.crc_hqx(block, 0xFFFF) != CASSETTE_CRC_RESIDUE: crc_ok = False
+    chunks.append(block[:CASSETTE_BLOCK_SIZE])
+    pos += len(block)
+  return b''.join(chunks)[:length], pos, crc_ok
+
+
+CassetteFile = collections.namedtuple('CassetteFile', 'name type length segment offset position data crc_ok')
+
+
+def read_cassette_files(data, compact=False):
+  '''Decode cassette data and yield a CassetteFile for each BASIC file found on it.'''
+  pos = 0
+  while True:
+    leader_pos, pos = find_cassette_record(data, pos, compact)
+    if leader_pos is None: return
+    try:
+      header, pos, crc_ok = read_cassette_blocks(data, pos, CASSETTE_BLOCK_SIZE)
+    except ValueError:
+      return
+    if not crc_ok or header[0] != BASIC_HEADER_SIGNATURE: continue  # not a header, so not the start of a file
+    name = header[1:9].decode('latin-1').rstrip(' ')
+    file_type = BASIC_FILE_TYPES.get(header[9], '?')
+    length, segment, offset = struct.unpack_from('<HHH', header, 10)
+    chunks = []
+    if file_type in ('A', 'D'):
+      # ASCII and data files are a series of one-block records, each starting with a byte that is 0 if 255 bytes follow and
+      #  more records come after it, or, in the last record, one more than the number of bytes that follow
+      while True:
+        _, record_pos = find_cassette_record(data, pos, compact)
+        if record_pos is None: break
+        try:
+          block, record_pos, block_crc_ok = read_cassette_blocks(data, record_pos, CASSETTE_BLOCK_SIZE)
+        except ValueError:
+          break
+        pos = record_pos
+        crc_ok = crc_ok and block_crc_ok
+        if block[0] == 0:
+          chunks.append(block[1:])
+        else:
+          chunks.append(block[1:block[0]])
+          break
+      length = sum(len(i) for i in chunks)
+    else:
+      _, record_pos = find_cassette_record(data, pos, compact)
+      try:
+        if record_pos is None: raise ValueError('cassette data ends before file contents')
+        chunk, pos, crc_ok = read_cassette_blocks(data, record_pos, length)
+        chunks.append(chunk)
+      except ValueError:
+        crc_ok = False
+    yield CassetteFile(name, file_type, length, segment, offset, leader_pos, b''.join(chunks), crc_ok)
+
+
+def compact_cassette_data(data):
+  '''Compact cassette data by replacing the leader (and any trailer before it) of every record with a leader token.'''
+  chunks = []
+  pos = 0
+  while True:
+    leader_pos, block_pos = find_cassette_record(data, pos)
+    if leader_pos is None: break
+    chunks.extend((data[pos:leader_pos], CASSETTE_LEADER_TOKEN, CASSETTE_SYNC))
+    pos = block_pos
+    # skip over the record's blocks so that runs of 0xFF bytes in them are left alone; the first block with a bad CRC is
+    #  taken to be the end of the record
+    while True:
+      block = data[pos:pos + CASSETTE_BLOCK_SIZE + CASSETTE_CRC_SIZE]
+      if len(block) != CASSETTE_BLOCK_SIZE + CASSETTE_CRC_SIZE: break
+      if binascii.crc_hqx(block, 0xFFFF) != CASSETTE_CRC_RESIDUE: break
+      pos += len(block)
+    chunks.append(data[block_pos:pos])
+  chunks.append(data[pos:])
+  return b''.join(chunks)
+
+
+def expand_cassette_data(data):
+  '''Yield compacted cassette data in pieces, putting a full leader back in place of the leader token of every record, and a
+  trailer after every record that had its trailer dropped.
+  '''
+  pos = 0
+  records = 0
+  while True:
+    leader_pos, block_pos = find_cassette_record(data, pos, True)
+    if leader_pos is None: break
+    if data[leader_pos:leader_pos + 1] == CASSETTE_LEADER_TOKEN:
+      yield data[pos:leader_pos]
+      if records: yield CASSETTE_TRAILER  # the token stands in for the trailer of the record before it too
+      yield CASSETTE_WRITE_LEADER
+      pos = leader_pos + 1
+    records += 1
+    # skip over the record's blocks so that 0xFD bytes in them are left alone, as compact_cassette_data does
+    while True:
+      block = data[block_pos:block_pos + CASSETTE_BLOCK_SIZE + CASSETTE_CRC_SIZE]
+      if len(block) != CASSETTE_BLOCK_SIZE + CASSETTE_CRC_SIZE: break
+      if binascii.crc_hqx(block, 0xFFFF) != CASSETTE_CRC_RESIDUE: break
+      block_pos += len(block)
+    yield data[pos:block_pos]
+    pos = block_pos
+  if records and data[pos:pos + len(CASSETTE_TRAILER)] != CASSETTE_TRAILER: yield CASSETTE_TRAILER  # compact write handler
+  yield data[pos:]
+
+
+def cassette_data_end(data, compact=False):
+  '''Return the length of cassette data with the zeros after the last byte written to it trimmed off.'''
+  end = len(data)
+  while end:  # look for the last block written a block at a time, then the last byte written in it
+    start = max(0, end - 512)
+    if data[start:end] != bytes(end - start): break
+    end = start
+  start = max(0, end - 512)
+  end = start + len(bytes(data[start:end]).rstrip(b'\x00'))
+  if compact:  # no trailer follows the last record on a compact tape, so zeros at the end of its last CRC count as written
+    pos = 0
+    while True:
+      leader_pos, pos = find_cassette_record(data, pos, True)
+      if leader_pos is None: break
+      while True:
+        block = data[pos:pos + CASSETTE_BLOCK_SIZE + CASSETTE_CRC_SIZE]
+        if len(block) != CASSETTE_BLOCK_SIZE + CASSETTE_CRC_SIZE: break
+        if binascii.crc_hqx(block, 0xFFFF) != CASSETTE_CRC_RESIDUE: break
+        pos += len(block)
+      end = max(end, pos)
+  return end
+
+
+_wav_gap = 2  # in decoded bits, stands for a gap in the signal
+_wav_unsigned = bytes(i ^ 0x80 for i in range(256))  # most significant byte of a signed sample to that of an unsigned one
+_wav_levels = [bytes(0 if i < 128 - t else 1 if i >= 128 + t else 2 for i in range(256)) for t in range(129)]  # by dead band
+_wav_edge = re.compile(b'(?<=\x00)\x02*\x01|(?<=\x01)\x02*\x00')
+_wav_ones = re.compile(b'\x01*')
+_wav_leader_sync = re.compile(b'\x01{%d,}\x00' % WAV_LEADER_BITS + bytes((0x16 >> i) & 1 for i in range(7, -1, -1)))
+_wav_bit_digits = bytes.maketrans(b'\x00\x01', b'01')
+
+
+def read_wav_bits(wav_file, chunk_frames=1 << 16):
+  '''Decode the cycles in a WAV recording of a cassette (given as a filename or a binary file object) a chunk at a time,
+  yielding bytearrays holding 1 for each long (1 bit) cycle, 0 for each short (0 bit) cycle, and 2 for each gap.
+  '''
+  with wave.open(wav_file, 'rb') as wav:
+    width, frame_size, rate = wav.getsampwidth(), wav.getsampwidth() * wav.getnchannels(), wav.getframerate()
+    # every cycle has exactly one high half whichever way up the recording is, so bits are told apart by those
+    min_half, one_half, gap = (rate * WAV_ONE_BIT_CYCLE * i for i in (0.1, 0.375, 2))
+    base = 0
+    level = b''  # last level that wasn't too close to call, carried over from the previous chunk, and where it was
+    level_pos = 0
+    last_rise = last_fall = None
+    peak = 0
+    while frames := wav.readframes(chunk_frames):
+      samples = frames[width - 1::frame_size]  # first channel, most significant byte only
+      if width > 1: samples = samples.translate(_wav_unsigned)
+      # samples within a quarter of the loudest signal so far of the middle are too close to call, so hiss isn't taken as cycles
+      peak = max(peak, max(samples[::16]) - 128, 128 - min(samples[::16]))
+      levels = level + samples.translate(_wav_levels[max(4, peak // 4)])
+      bits = bytearray()
+      for match in _wav_edge.finditer(levels):
+        before = match.start() - 1 - len(level)  # last sample before those too close to call
+        start, end = (level_pos if before < 0 else base + before) + 1, base + match.end() - 1 - len(level)
+        if end - start > one_half:
+          old_end, new_start = start, end  # signal stopped in between
+        else:
+          old_end = new_start = (start + end - 1) / 2
+        if levels[match.end() - 1]:
+          if last_fall is not None and new_start - last_fall > gap: bits.append(_wav_gap)
+          last_rise = new_start
+        elif last_rise is not None:
+          last_fall = old_end
+          if old_end - last_rise > min_half: bits.append(1 if old_end - last_rise > one_half else 0)  # shorter is a glitch
+      last = max(levels.rfind(b'\x00'), levels.rfind(b'\x01'))
+      if last >= len(level): level, level_pos = levels[last:last + 1], base + last - len(level)
+      base += len(samples)
+      yield bits
+  yield bytes((_wav_gap,))  # the recording ending is a gap too
+
+
+def decode_cassette_bits(bit_chunks, stats=None):
+  '''Decode bits from read_wav_bits into records and yield them as cassette data, each with the leader, sync bit, sync byte, and
+  trailer the write handler would give it; count records, blocks, and blocks with bad CRCs in stats if given a Counter.
+  '''
+  if stats is None: stats = collections.Counter()
+  block_bits = (CASSETTE_BLOCK_SIZE + CASSETTE_CRC_SIZE) * 8
+  bits = bytearray()
+  pos = 0
+  in_record = False
+  for chunk in bit_chunks:
+    bits += chunk
+    while True:
+      if not in_record:
+        match = _wav_leader_sync.search(bits, pos)
+        if match is None:
+          pos = max(pos, len(bits) - WAV_LEADER_BITS - 8)  # keep what could be the start of a leader
+          break
+        pos = match.end()
+        in_record = True
+        stats['records'] += 1
+        yield b''.join((CASSETTE_WRITE_LEADER, CASSETTE_SYNC))
+        continue
+      # the record ends at a gap or at another leader, perhaps after a trailer; otherwise a block follows
+      run_end = _wav_ones.match(bits, pos).end()
+      if run_end + 9 > len(bits) and _wav_gap not in bits[run_end:] and run_end - pos < 4 * block_bits: break
+      if _wav_gap in bits[run_end:run_end + 1] or _wav_leader_sync.match(bits, pos) or run_end - pos >= 4 * block_bits:
+        in_record = False  # leave pos where it is so a leader just after the trailer is found
+        yield CASSETTE_TRAILER
+        continue
+      gap = bits.find(_wav_gap, pos, pos + block_bits)
+      if gap == -1 and len(bits) < pos + block_bits: break
+      end = pos + block_bits if gap == -1 else gap - (gap - pos) % 8
+      block = int(bits[pos:end].translate(_wav_bit_digits) or b'0', 2).to_bytes((end - pos) // 8, 'big')
+      stats['blocks'] += 1
+      if gap != -1 or binascii.crc_hqx(block, 0xFFFF) != CASSETTE_CRC_RESIDUE: stats['bad_blocks'] += 1
+      yield block
+      pos = end if gap == -1 else gap
+    del bits[:pos]
+    pos = 0
+
+
+def read_wav_cassette(wav_file, name, stats=None):
+  '''Decode a WAV recording of a cassette (given as a filename or a binary file object) and yield it as cassette data.'''
   try:
-    rom_file_set_and_sha256_sum, rom_data = [(k, rom_data) for k, rom_data in basic_roms.items() if rom_data is not None][-1]
-    rom_file_set, rom_sha256_sum = rom_file_set_and_sha256_sum
-    sys.stderr.write(f'using rom set {rom_file_set}\n')
-    return rom_data
-  except IndexError:
-    return None
+    yield from decode_cassette_bits(read_wav_bits(wav_file), stats)
+  except wave.Error as e:
+    raise ValueError(f"couldn't read WAV file {name}: {str(e)}")
+  except (RuntimeError, struct.error):  # what wave lets out on malformed RIFF and chunk headers
+    raise ValueError(f"couldn't read WAV file {name}: its chunks are malformed")
+  except EOFError:
+    raise ValueError(f'WAV file {name} is truncated')
+
+
+def is_wav_file(fp):
+  '''Return whether a binary file object is a WAV file, leaving it where it was.'''
+  pos = fp.tell()
+  header = fp.read(12)
+  fp.seek(pos)
+  return header[:4] == b'RIFF' and header[8:] == b'WAVE'
+
+
+def make_tape_directory(cassette_data, compact=False, save_counters=False, library=False):
+  '''Make the tape directory sector that lets the handler seek straight to the first files on the cassette (and holds its
+  counters, starting from zero).
+  '''
+  entries = []
+  for cassette_file in itertools.islice(read_cassette_files(cassette_data, compact), TAPE_DIRECTORY_ENTRIES):
+    block, offset = divmod(cassette_file.position, 512)
+    entries.append(TAPE_DIRECTORY_ENTRY.pack(cassette_file.name.ljust(8).encode('latin-1'), cassette_file.type.encode('latin-1'),
+                                             cassette_file.length, block, offset))
+  directory = bytearray(b''.join(entries).ljust(TAPE_DIRECTORY_SIZE, b'\x00'))
+  if compact: directory[TAPE_DIRECTORY_FLAGS] |= TAPE_FLAG_COMPACT
+  if save_counters: directory[TAPE_DIRECTORY_FLAGS] |= TAPE_FLAG_STATS
+  if library: directory[TAPE_DIRECTORY_FLAGS] |= TAPE_FLAG_LIBRARY
+  return bytes(directory)
+
+
+_zero_sectors = memoryview(bytes(128 * 512))
+
+
+def _zero_fill(view):
+  '''Fill a buffer with zeros without allocating a buffer of zeros its size.'''
+  for pos in range(0, len(view), len(_zero_sectors)):
+    chunk = view[pos:pos + len(_zero_sectors)]
+    chunk[:] = _zero_sectors[:len(chunk)]
+
+
+def _load_cassette(cassette, view, compact):
+  '''Read a cassette file (given as a filename or a binary file object) or a WAV recording of one (given as a filename) into a
+  buffer, return its length.
+  '''
+  if not isinstance(cassette, (str, bytes, os.PathLike)):
+    return _read_cassette(cassette, view, compact, getattr(cassette, 'name', '<stream>'))
+  with open(cassette, 'rb') as fp:
+    if is_wav_file(fp): return _read_cassette(io.BytesIO(b''.join(read_wav_cassette(fp, cassette))), view, compact, cassette)
+    return _read_cassette(fp, view, compact, cassette)
+
+
+def plan_tape_library(lengths, blocks):
+  '''Lay out a tape library for tapes of the given lengths in a cassette of the given number of blocks, return the block where
+  each tape begins and the number of blocks of data on it, sharing the blocks left over out evenly among them.
+  '''
+  if not 1 <= len(lengths) <= TAPE_LIBRARY_TAPES: raise ValueError(f'a tape library holds 1 to {TAPE_LIBRARY_TAPES} tapes')
+  needed = [-(-length // 512) for length in lengths]
+  spare = blocks - 1 - len(needed) - sum(needed)  # less the tape table and each tape's directory
+  if spare < 0: raise ValueError(f'cassettes are {-spare * 512} bytes too long to fit in a tape library on this diskette')
+  layout = []
+  block = 1
+  for tape_blocks in needed:
+    tape_blocks += spare // len(needed)
+    layout.append((block, tape_blocks))
+    block += 1 + tape_blocks
+  return layout
+
+
+def build_image(rom, cassette=None, out=None, geometry=DISK_GEOMETRIES[DEFAULT_GEOMETRY], compact=False,
+                save_counters=False):
+  '''Build a CassBox diskette image from a BASIC ROM and a cassette file (given as a filename or a binary file object, or None
+  for a blank cassette) or a WAV recording of one (given as a filename), or a list of them for a tape library, into a
+  preallocated buffer, or a new one if none is given, and return the buffer.
+  '''
+  if len(rom) != BASIC_ROM_SIZE * BASIC_ROM_NUMBER_OF_CHIPS:
+    raise ValueError(f'BASIC ROM must be {BASIC_ROM_SIZE * BASIC_ROM_NUMBER_OF_CHIPS} bytes')
+  if out is None: out = bytearray(disk_image_size(geometry))
+  view = memoryview(out)
+  if len(view) != disk_image_size(geometry):
+    raise ValueError(f'buffer must be {disk_image_size(geometry)} bytes to hold a diskette image of this geometry')
+  view[:len(CASSBOX_BIN)] = make_cassbox_bin(geometry)
+  view[len(CASSBOX_BIN):TAPE_DIRECTORY_POSITION] = rom
+  cassette_view = view[CASSETTE_POSITION:]
+  if isinstance(cassette, (list, tuple)):
+    _build_tape_library(view, cassette, compact, save_counters)
+    return out
+  length = 0 if cassette is None else _load_cassette(cassette, cassette_view, compact)
+  _zero_fill(cassette_view[length:])
+  view[TAPE_DIRECTORY_POSITION:CASSETTE_POSITION] = make_tape_directory(cassette_view[:length], compact, save_counters)
+  return out
+
+
+def _build_tape_library(view, cassettes, compact, save_counters):
+  '''Fill the cassette of a diskette image being built with a tape library of the given cassettes.'''
+  cassette_view = view[CASSETTE_POSITION:]
+  tapes = []
+  for cassette in cassettes:  # read each into place in turn to find its length, then keep it aside
+    length = _load_cassette(cassette, cassette_view, compact)
+    tapes.append(bytes(cassette_view[:length]))
+  layout = plan_tape_library([len(tape) for tape in tapes], len(cassette_view) // 512)
+  _zero_fill(cassette_view)
+  TAPE_LIBRARY_ENTRY.pack_into(cassette_view, 0, len(layout), 0)
+  for number, (tape, (block, blocks)) in enumerate(zip(tapes, layout), 1):
+    TAPE_LIBRARY_ENTRY.pack_into(cassette_view, number * TAPE_LIBRARY_ENTRY.size, block, blocks)
+    directory = block * TAPE_DIRECTORY_SIZE
+    cassette_view[directory:directory + TAPE_DIRECTORY_SIZE] = make_tape_directory(tape, compact)
+    cassette_view[directory + TAPE_DIRECTORY_SIZE:directory + TAPE_DIRECTORY_SIZE + len(tape)] = tape
+  # the handler switches to the first tape on the first cassette operation, loading its directory entries in place of these
+  view[TAPE_DIRECTORY_POSITION:CASSETTE_POSITION] = make_tape_directory(tapes[0], compact, save_counters, library=True)
+
+
+def default_image_cache_path():
+  '''Return the default location of the diskette image cache.'''
+  cache_dir = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+  return os.path.join(cache_dir, 'cassbox', 'images')
+
+
+def image_cache_key(rom, cassette_path, geometry=DISK_GEOMETRIES[DEFAULT_GEOMETRY], compact=False, save_counters=False):
+  '''Return the SHA-256 (as hex) of everything that goes into building a diskette image from the given inputs.'''
+  sha = hashlib.sha256(struct.pack('<BBB', IMAGE_CACHE_VERSION, compact, save_counters))
+  sha.update(make_cassbox_bin(geometry))
+  sha.update(rom)
+  if isinstance(cassette_path, (list, tuple)):
+    for path in cassette_path:  # each tape's length goes in too, so the same data split differently comes out different
+      sha.update(struct.pack('<Q', os.path.getsize(path)))
+      with open(path, 'rb') as fp:
+        while chunk := fp.read(65536): sha.update(chunk)
+  elif cassette_path is not None:
+    with open(cassette_path, 'rb') as fp:
+      while chunk := fp.read(65536): sha.update(chunk)
+  return sha.hexdigest()
+
+
+def link_cached_image(cached_path, output_path, hardlink=False):
+  '''Put a cached diskette image at output_path, as a hard link if asked and possible, otherwise as a reflink (sharing the
+  cached image's data until either is written) if possible, otherwise as a copy; whichever it is replaces what was at
+  output_path rather than being written through it, in case that was a hard link to a cached image.
+  '''
+  temp_path = f'{output_path}.{os.getpid()}.tmp'
+  if hardlink:
+    try:
+      os.link(cached_path, temp_path)
+      os.replace(temp_path, output_path)
+      return
+    except OSError:
+      pass  # e.g. cache is on another filesystem
+  with open(cached_path, 'rb') as cached_fp, open(temp_path, 'wb') as output_fp:
+    try:
+      if fcntl is None: raise OSError
+      fcntl.ioctl(output_fp.fileno(), FICLONE, cached_fp.fileno())
+    except OSError:
+      shutil.copyfileobj(cached_fp, output_fp, 1 << 20)  # filesystem can't do it
+  os.replace(temp_path, output_path)
+
+
+def build_image_file(output_path, rom, cassette=None, geometry=DISK_GEOMETRIES[DEFAULT_GEOMETRY], compact=False, out=None,
+                     cache_dir=None, hardlink=False, save_counters=False):
+  '''Build a CassBox diskette image file, or, given a cache directory, reuse an image already built there from the same
+  inputs, building and caching it if there isn't one.
+  '''
+  paths = cassette if isinstance(cassette, (list, tuple)) else [cassette]
+  if cache_dir is None or not all(i is None or isinstance(i, (str, bytes, os.PathLike)) for i in paths):
+    image = build_image(rom, cassette, out, geometry, compact, save_counters)
+    temp_path = f'{output_path}.{os.getpid()}.tmp'  # replace what's at output_path, it may be hard-linked to a cached image
+    with open(temp_path, 'wb') as fp:
+      fp.write(image)
+    os.replace(temp_path, output_path)
+    return
+  cached_path = os.path.join(cache_dir, f'{image_cache_key(rom, cassette, geometry, compact, save_counters)}.img')
+  if not os.path.exists(cached_path):
+    image = build_image(rom, cassette, out, geometry, compact, save_counters)
+    os.makedirs(cache_dir, exist_ok=True)
+    temp_path = f'{cached_path}.{os.getpid()}.tmp'
+    with open(temp_path, 'wb') as fp:
+      fp.write(image)
+    os.replace(temp_path, cached_path)
+  link_cached_image(cached_path, output_path, hardlink)
+
+
+def swap_cassette(image_path, cassette_path, compact=False, tape=1):
+  '''Replace the cassette (and tape directory) of a CassBox diskette image, or one tape of its tape library, in place, leaving
+  CassBox and the BASIC ROM be; the handler's counters start over, but if they were being saved to the image they still are.
+  '''
+  with open(image_path, 'r+b') as fp, mmap.mmap(fp.fileno(), 0) as image:
+    if find_disk_image_geometry(image) is None: raise ValueError(f'{image_path} is not a CassBox diskette image')
+    flags = image[TAPE_DIRECTORY_POSITION + TAPE_DIRECTORY_FLAGS]
+    library = bool(flags & TAPE_FLAG_LIBRARY)
+    if library and compact != bool(flags & TAPE_FLAG_COMPACT):
+      raise ValueError(f'{image_path} is a tape library of {"" if flags & TAPE_FLAG_COMPACT else "un"}compacted tapes, swap'
+                       f' {"with" if flags & TAPE_FLAG_COMPACT else "without"} --compact')
+    directory, start, end = find_tape(image, tape, image_path)
+    cassette_data = read_cassette_file(cassette_path, compact, end - start)
+    if library:
+      image[directory:start] = make_tape_directory(cassette_data, compact)
+      if tape == 1:
+        image[TAPE_DIRECTORY_POSITION:CASSETTE_POSITION] = make_tape_directory(cassette_data, compact,
+                                                                               bool(flags & TAPE_FLAG_STATS), library)
+    else:
+      image[TAPE_DIRECTORY_POSITION:CASSETTE_POSITION] = make_tape_directory(cassette_data, compact,
+                                                                             bool(flags & TAPE_FLAG_STATS))
+    image[start:end] = cassette_data
+    image.flush()
+
+
+def sync_cassette(image_path, cassette_path, tape=1):
+  '''Write the cassette of a CassBox diskette image, or one tape of its tape library, up to the last byte written to it, out
+  to a cassette file.
+  '''
+  with open(image_path, 'rb') as fp, mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as image:
+    if find_disk_image_geometry(image) is None: raise ValueError(f'{image_path} is not a CassBox diskette image')
+    compact = bool(image[TAPE_DIRECTORY_POSITION + TAPE_DIRECTORY_FLAGS] & TAPE_FLAG_COMPACT)
+    _, start, end = find_tape(image, tape, image_path)
+    with memoryview(image)[start:end] as cassette_data, open(cassette_path, 'wb') as cassette_fp:
+      end = cassette_data_end(cassette_data, compact)
+      if compact:
+        cassette_fp.writelines(expand_cassette_data(cassette_data[:end]))  # leader tokens mean nothing outside CassBox
+      else:
+        cassette_fp.write(cassette_data[:end])
+
+
+_batch_options = None
+_batch_buffer = None
+
+
+def _init_batch_worker(options):
+  '''Stash the BASIC ROM and options shared by every job in a batch worker process, and allocate a buffer to build in.'''
+  global _batch_options, _batch_buffer
+  _batch_options = options
+  _batch_buffer = bytearray(disk_image_size(options['geometry']))
+
+
+def _run_batch_job(cassette_path, output_path):
+  '''Build one diskette image in a batch worker process, return an error message or None on success.'''
+  try:
+    build_image_file(output_path, cassette=cassette_path, out=_batch_buffer, **_batch_options)
+  except (OSError, ValueError) as e:
+    return str(e)
+  except Exception as e:  # anything else going wrong with one cassette file shouldn't take the rest of the batch down
+    return f"couldn't build {output_path} from {cassette_path}: {type(e).__name__}: {str(e)}"
+  return None
+
+
+def build_batch(rom, cassette_dir, output_dir, jobs=None, geometry=DISK_GEOMETRIES[DEFAULT_GEOMETRY], compact=False,
+                cache_dir=None, hardlink=False, save_counters=False):
+  '''Build a diskette image in output_dir for every cassette file in cassette_dir, return the number of failures.'''
+  cassette_files = sorted(i for i in os.listdir(cassette_dir) if i.lower().endswith(('.cas', '.wav')))
+  failures = 0
+  cassette_paths = []
+  output_paths = []
+  built_from = {}
+  for cassette_file in cassette_files:  # e.g. a.cas and a.wav, or A.CAS and a.cas, would both be built into a.img
+    output_file = f'{os.path.splitext(cassette_file)[0]}.img'
+    if output_file.lower() in built_from:
+      sys.stderr.write(f'{os.path.join(cassette_dir, cassette_file)} would be built into the same image as'
+                       f' {built_from[output_file.lower()]}, skipping it\n')
+      failures += 1
+      continue
+    cassette_paths.append(os.path.join(cassette_dir, cassette_file))
+    output_paths.append(os.path.join(output_dir, output_file))
+    built_from[output_file.lower()] = cassette_paths[-1]
+  os.makedirs(output_dir, exist_ok=True)
+  options = {'rom': rom, 'geometry': geometry, 'compact': compact, 'cache_dir': cache_dir, 'hardlink': hardlink,
+             'save_counters': save_counters}
+  with concurrent.futures.ProcessPoolExecutor(jobs, initializer=_init_batch_worker, initargs=(options,)) as executor:
+    for error in executor.map(_run_batch_job, cassette_paths, output_paths, chunksize=16):
+      if error is None: continue
+      sys.stderr.write(f'{error}\n')
+      failures += 1
+  sys.stderr.write(f'built {len(cassette_files) - failures} of {len(cassette_files)} images\n')
+  return failures
+
+
+BasicFile = collections.namedtuple('BasicFile', 'name type data segment offset')
+
+
+def read_basic_file(filepath, segment=0, offset=0):
+  '''Read a BASIC file to put on a cassette, as extract writes them: named after the file (up to eight characters) and typed
+  by its extension, with the segment and offset given if it's a memory image.
+  '''
+  stem, extension = os.path.splitext(os.path.basename(filepath))
+  file_type = BASIC_FILE_TYPES_BY_EXTENSION.get(extension.lower())
+  if file_type is None: raise ValueError(f"can't tell what type of BASIC file {filepath} is from its extension")
+  name = stem[:8]
+  try:
+    name.encode('latin-1')
+  except UnicodeEncodeError:
+    raise ValueError(f"{filepath} can't be named {name} on a cassette") from None
+  with open(filepath, 'rb') as fp:
+    return BasicFile(name, file_type, fp.read(), segment, offset)
+
+
+def make_basic_header(name, file_type, length, segment=0, offset=0):
+  '''Make the header block that BASIC saves before a file.'''
+  header = BASIC_HEADER.pack(BASIC_HEADER_SIGNATURE, name.ljust(8).encode('latin-1'), BASIC_FILE_TYPE_CODES[file_type], length,
+                             segment, offset)
+  return header.ljust(CASSETTE_BLOCK_SIZE, b'\x00')
+
+
+def make_cassette_record(data):
+  '''Make a record the way the write handler writes it: leader, sync bit and byte, the data in blocks each followed by its
+  CRC, and trailer; the last block is filled out with the last byte written, as the write handler does.
+  '''
+  data = bytes(data)
+  pieces = [CASSETTE_WRITE_LEADER, CASSETTE_SYNC]
+  fill = data[-1:] or CASSETTE_SYNC[-1:]
+  for pos in range(0, len(data) or 1, CASSETTE_BLOCK_SIZE):
+    block = data[pos:pos + CASSETTE_BLOCK_SIZE]
+    block += fill * (CASSETTE_BLOCK_SIZE - len(block))
+    pieces.append(block)
+    pieces.append((binascii.crc_hqx(block, 0xFFFF) ^ 0xFFFF).to_bytes(CASSETTE_CRC_SIZE, 'big'))
+  pieces.append(CASSETTE_TRAILER)
+  return b''.join(pieces)
+
+
+def make_cassette_data(basic_files, size=None):
+  '''Yield cassette data for BasicFiles a record at a time, laid out the way BASIC saves them through the write handler; if
+  given a size, raise ValueError as soon as the cassette would be longer than that.
+  '''
+  total = 0
+  for basic_file in basic_files:
+    name, file_type, data = basic_file.name, basic_file.type, basic_file.data
+    if file_type in ('A', 'D'):
+      # a series of one-block records, each starting with 0 if 255 bytes follow and more records come after it, or, in the
+      #  last record, one more than the number of bytes that follow (see read_cassette_files)
+      chunks = [data[i:i + BASIC_RECORD_DATA_SIZE] for i in range(0, len(data), BASIC_RECORD_DATA_SIZE)]
+      if not chunks or len(chunks[-1]) == BASIC_RECORD_DATA_SIZE: chunks.append(b'')
+      contents = [b'\x00' + chunk for chunk in chunks[:-1]]
+      contents.append((bytes((len(chunks[-1]) + 1,)) + chunks[-1]).ljust(CASSETTE_BLOCK_SIZE, b'\x00'))
+      length = 0
+    else:
+      if len(data) > 0xFFFF: raise ValueError(f'{name} is {len(data)} bytes in length, more than a cassette file can hold')
+      contents = [data]
+      length = len(data)
+    header = make_basic_header(name, file_type, length, basic_file.segment, basic_file.offset)
+    for record in itertools.chain((header,), contents):
+      record = make_cassette_record(record)
+      total += len(record)
+      if size is not None and total > size:
+        raise ValueError(f'cassette would be longer than the maximum size of {size} bytes with {name} on it')
+      yield record
+
+
+def main_list(argv):
+  parser = argparse.ArgumentParser(prog=f'{os.path.basename(sys.argv[0])} {argv[0]}',
+                                   description='List the BASIC files on CassBox diskette images and/or cassette files.')
+  parser.add_argument('filenames', metavar='FILENAME', nargs='+', help='diskette image or cassette file to list')
+  args = parser.parse_args(argv[1:])
+  
+  result = 0
+  for filename in args.filenames:
+    try:
+      tapes, compact = read_cassette_tapes(filename)
+    except OSError as e:
+      sys.stderr.write(f'{str(e)}\n')
+      result = 3
+      continue
+    for number, data in enumerate(tapes, 1):
+      tape = f' tape {number}' if len(tapes) > 1 else ''
+      for cassette_file in read_cassette_files(data, compact):
+        block, offset = divmod(cassette_file.position, 512)
+        location = f' {cassette_file.segment:04X}:{cassette_file.offset:04X}' if cassette_file.type == 'M' else ''
+        problem = '' if cassette_file.crc_ok else ' (bad CRC)'
+        sys.stdout.write(f'{filename}{tape}: {cassette_file.name:8} {cassette_file.type} {cassette_file.length:5} bytes'
+                         f'{location}, block {block} offset {offset}{problem}\n')
+  return result
+
+
+def main_extract(argv):
+  parser = argparse.ArgumentParser(prog=f'{os.path.basename(sys.argv[0])} {argv[0]}',
+                                   description='Extract BASIC files from a CassBox diskette image or cassette file.')
+  parser.add_argument('filename', metavar='FILENAME', help='diskette image or cassette file to extract from')
+  parser.add_argument('names', metavar='NAME', nargs='*', help='names of files on the cassette to extract (default: all)')
+  parser.add_argument('--output-dir', metavar='DIRECTORY', default='.', help='directory to extract files into')
+  parser.add_argument('--tape', metavar='N', type=int, default=1, help='tape to extract from, if the diskette image holds a'
+                                                                       ' tape library (default: %(default)s)')
+  args = parser.parse_args(argv[1:])
+  
+  try:
+    data, compact = read_cassette_data(args.filename, args.tape)
+  except (OSError, ValueError) as e:
+    sys.stderr.write(f'{str(e)}\n')
+    return 3
+  os.makedirs(args.output_dir, exist_ok=True)
+  result = 0
+  used = set()
+  for cassette_file in read_cassette_files(data, compact):
+    if args.names and cassette_file.name not in args.names: continue
+    stem = re.sub(r'[^A-Za-z0-9_.-]', '_', cassette_file.name) or 'NONAME'
+    extension = BASIC_FILE_EXTENSIONS.get(cassette_file.type, '.bin')
+    filename = f'{stem}{extension}'
+    copy = 1
+    while filename.lower() in used:
+      copy += 1
+      filename = f'{stem}.{copy}{extension}'
+    used.add(filename.lower())
+    with open(os.path.join(args.output_dir, filename), 'wb') as fp:
+      fp.write(cassette_file.data)
+    if not cassette_file.crc_ok:
+      sys.stderr.write(f'warning, {cassette_file.name} has a bad CRC, extracted it to {filename} anyway\n')
+      result = 4
+  return result
+
+
+def main_swap(argv):
+  parser = argparse.ArgumentParser(prog=f'{os.path.basename(sys.argv[0])} {argv[0]}',
+                                   description='Replace the cassette in a CassBox diskette image without rebuilding it.')
+  parser.add_argument('image', metavar='FILENAME.IMG', help='diskette image to change the cassette in')
+  parser.add_argument('cassette', metavar='FILENAME.CAS', help='cassette file to put in the diskette image')
+  parser.add_argument('--compact', action='store_true', help='store leaders on the cassette as one-byte tokens so more fits on'
+                                                              ' it')
+  parser.add_argument('--tape', metavar='N', type=int, default=1, help='tape to replace, if the diskette image holds a tape'
+                                                                       ' library (default: %(default)s)')
+  args = parser.parse_args(argv[1:])
+  
+  try:
+    swap_cassette(args.image, args.cassette, args.compact, args.tape)
+  except (OSError, ValueError) as e:
+    sys.stderr.write(f'{str(e)}\n')
+    return 3
+  return 0
+
+
+def main_sync(argv):
+  parser = argparse.ArgumentParser(prog=f'{os.path.basename(sys.argv[0])} {argv[0]}',
+                                   description='Copy the cassette in a CassBox diskette image, as written by BASIC, out to a'
+                                               ' cassette file.')
+  parser.add_argument('image', metavar='FILENAME.IMG', help='diskette image to copy the cassette from')
+  parser.add_argument('cassette', metavar='FILENAME.CAS', help='cassette file to write')
+  parser.add_argument('--tape', metavar='N', type=int, default=1, help='tape to copy, if the diskette image holds a tape'
+                                                                       ' library (default: %(default)s)')
+  args = parser.parse_args(argv[1:])
+  
+  try:
+    sync_cassette(args.image, args.cassette, args.tape)
+  except (OSError, ValueError) as e:
+    sys.stderr.write(f'{str(e)}\n')
+    return 3
+  return 0
+
+
+def main_wav2cas(argv):
+  parser = argparse.ArgumentParser(prog=f'{os.path.basename(sys.argv[0])} {argv[0]}',
+                                   description='Decode a WAV recording of a real cassette into a cassette file.')
+  parser.add_argument('wav', metavar='FILENAME.WAV', help='recording to decode')
+  parser.add_argument('cassette', metavar='FILENAME.CAS', help='cassette file to write')
+  args = parser.parse_args(argv[1:])
+  
+  stats = collections.Counter()
+  try:
+    with open(args.cassette, 'wb') as fp:
+      fp.writelines(read_wav_cassette(args.wav, args.wav, stats))
+  except (OSError, ValueError) as e:
+    sys.stderr.write(f'{str(e)}\n')
+    return 3
+  sys.stderr.write(f'decoded {stats["records"]} records, {stats["blocks"]} blocks\n')
+  if stats['bad_blocks']:
+    sys.stderr.write(f'warning, {stats["bad_blocks"]} blocks have bad CRCs, wrote them anyway\n')
+    return 4
+  return 0
+
+
+def main_stats(argv):
+  parser = argparse.ArgumentParser(prog=f'{os.path.basename(sys.argv[0])} {argv[0]}',
+                                   description="Show the cassette handler's counters from CassBox diskette images and/or"
+                                               ' memory dumps.')
+  parser.add_argument('filenames', metavar='FILENAME', nargs='+', help='diskette image or memory dump to read counters from')
+  args = parser.parse_args(argv[1:])
+  
+  result = 0
+  for filename in args.filenames:
+    try:
+      counters, saved = read_handler_counters(filename)
+    except (OSError, ValueError) as e:
+      sys.stderr.write(f'{str(e)}\n')
+      result = 3
+      continue
+    if not saved:
+      sys.stderr.write(f'warning, {filename} was not built with --save-counters, so its counters are never saved to it\n')
+    for label, value in zip(HANDLER_COUNTER_LABELS, counters):
+      sys.stdout.write(f'{filename}: {label:24} {value:10}\n')
+  return result
+
+
+def _load_address(text):
+  '''Parse a SEGMENT:OFFSET (in hex) command line argument.'''
+  match = re.fullmatch(r'([0-9A-Fa-f]{1,4}):([0-9A-Fa-f]{1,4})', text)
+  if match is None: raise argparse.ArgumentTypeError(f'{text} is not a SEGMENT:OFFSET address in hex')
+  return int(match.group(1), 16), int(match.group(2), 16)
+
+
+def main_mkcas(argv):
+  parser = argparse.ArgumentParser(prog=f'{os.path.basename(sys.argv[0])} {argv[0]}',
+                                   description='Make a cassette file from BASIC files, as BASIC would save them.')
+  parser.add_argument('cassette', metavar='FILENAME.CAS', help='cassette file to write')
+  parser.add_argument('filenames', metavar='FILENAME', nargs='+', help='BASIC file to put on the cassette, typed by its'
+                                                                        ' extension as extract names them (.bas, .asc,'
+                                                                        ' .dat, or .bin)')
+  parser.add_argument('--load-address', metavar='SEGMENT:OFFSET', type=_load_address, default=(0, 0),
+                      help='where memory images (.bin) are loaded, in hex (default: 0000:0000)')
+  parser.add_argument('--geometry', choices=DISK_GEOMETRIES, default=DEFAULT_GEOMETRY,
+                      help='size of diskette image the cassette must fit on (default: %(default)s)')
+  args = parser.parse_args(argv[1:])
+  
+  basic_files = (read_basic_file(filename, *args.load_address) for filename in args.filenames)
+  temp_path = f'{args.cassette}.{os.getpid()}.tmp'  # so a failure partway doesn't leave a partial cassette file behind
+  try:
+    with open(temp_path, 'wb') as fp:
+      fp.writelines(make_cassette_data(basic_files, cassette_size(DISK_GEOMETRIES[args.geometry])))
+    os.replace(temp_path, args.cassette)
+  except (OSError, ValueError) as e:
+    sys.stderr.write(f'{str(e)}\n')
+    try:
+      os.unlink(temp_path)
+    except OSError:
+      pass  # never got created
+    return 3
+  return 0
+
+
+COMMANDS = {'list': main_list, 'extract': main_extract, 'swap': main_swap, 'sync': main_sync, 'wav2cas': main_wav2cas,
+            'stats': main_stats, 'mkcas': main_mkcas}
 
 
 def main(argv):
-  parser = argparse.ArgumentParser(description='Assemble a bootable 320 KB diskette image for DOSBox from a cassette BASIC ROM'
+  if len(argv) > 1 and argv[1] in COMMANDS: return COMMANDS[argv[1]](argv[1:])
+  
+  parser = argparse.ArgumentParser(description='Assemble a bootable diskette image for DOSBox from a cassette BASIC ROM'
                                                ' dump and, optionally, a cassette file.')
   source = parser.add_mutually_exclusive_group(required=True)
   source.add_argument('--rom', metavar='FILENAME.BIN', help='filename of a cassette BASIC ROM dump')
   source.add_argument('--mamedir', metavar='DIRECTORY', help='path to a MAME directory where ibm5150 ROMs can be found')
+  parser.add_argument('--mame-index', metavar='FILENAME.JSON', default=default_mame_index_path(),
+                      help='index of BASIC ROMs previously found under --mamedir (default: %(default)s)')
+  parser.add_argument('--rescan', action='store_true', help='ignore the index and walk the whole --mamedir again')
   parser.add_argument('--output', metavar='FILENAME.IMG', default='cassbox.img', help='filename for produced diskette image')
-  parser.add_argument('--cassette', metavar='FILENAME.CAS', help='cassette file to package into diskette image')
+  cassette = parser.add_mutually_exclusive_group()
+  cassette.add_argument('--cassette', metavar='FILENAME.CAS', nargs='+',
+                        help='cassette file (or WAV recording of one) to package into diskette image, or several to package'
+                             ' into it as a tape library that BASIC can switch between')
+  cassette.add_argument('--cassette-dir', metavar='DIRECTORY', help='directory of cassette files (and/or WAV recordings of'
+                                                                    ' them) to package into one diskette image each (requires'
+                                                                    ' --output-dir)')
+  parser.add_argument('--output-dir', metavar='DIRECTORY', help='directory for diskette images produced from --cassette-dir')
+  parser.add_argument('--geometry', choices=DISK_GEOMETRIES, default=DEFAULT_GEOMETRY,
+                      help='size of diskette image to build, larger ones hold longer cassettes (default: %(default)s)')
+  parser.add_argument('--compact', action='store_true', help='store leaders on the cassette as one-byte tokens so more fits on'
+                                                              ' it')
+  parser.add_argument('--save-counters', action='store_true', help='have the handler save its counters to the diskette image'
+                                                                    ' whenever the cassette motor is turned off, for stats')
+  parser.add_argument('--cache', action='store_true', help='reuse a diskette image already built from the same inputs, if'
+                                                            ' there is one, and keep the ones built for reuse')
+  parser.add_argument('--cache-dir', metavar='DIRECTORY', default=default_image_cache_path(),
+                      help='where --cache keeps diskette images (default: %(default)s)')
+  parser.add_argument('--hardlink', action='store_true', help='hard-link images out of the cache rather than copying them,'
+                                                              ' only for images that won\'t be written to')
+  parser.add_argument('--jobs', metavar='N', type=int, help='number of worker processes for --cassette-dir (default: one per'
+                                                            ' CPU)')
   args = parser.parse_args(argv[1:])
+  if args.hardlink and not args.cache: parser.error('--hardlink requires --cache')
+  if args.cassette_dir and not args.output_dir: parser.error('--cassette-dir requires --output-dir')
+  if args.output_dir and not args.cassette_dir: parser.error('--output-dir requires --cassette-dir')
   
   if args.mamedir:
-    basic_rom = get_mame_basic_rom(args.mamedir)
+    basic_rom = get_mame_basic_rom(args.mamedir, args.mame_index, args.rescan)
     if basic_rom is None:
       sys.stderr.write(f"couldn't find a valid set of BASIC ROMs in {args.mamedir}\n")
       return 1
@@ -369,19 +2010,25 @@ def main(argv):
     if hashlib.sha256(basic_rom).hexdigest() not in BASIC_SHA256_SUMS:
       sys.stderr.write('warning, the ROM file is not a known BASIC ROM, proceeding anyway\n')
   
-  if args.cassette:
+  geometry = DISK_GEOMETRIES[args.geometry]
+  cache_dir = args.cache_dir if args.cache else None
+  
+  if args.cassette_dir:
     try:
-      cassette_data = read_cassette_file(args.cassette)
-    except ValueError as e:
+      failures = build_batch(basic_rom, args.cassette_dir, args.output_dir, args.jobs, geometry, args.compact, cache_dir,
+                             args.hardlink, args.save_counters)
+    except OSError as e:  # e.g. no such cassette directory
       sys.stderr.write(f'{str(e)}\n')
       return 3
-  else:
-    cassette_data = bytes(CASSETTE_SIZE)
+    return 3 if failures else 0
   
-  with open(args.output, 'wb') as fp:
-    fp.write(CASSBOX_BIN)
-    fp.write(basic_rom)
-    fp.write(cassette_data)
+  try:
+    cassette = args.cassette[0] if args.cassette and len(args.cassette) == 1 else args.cassette
+    build_image_file(args.output, basic_rom, cassette, geometry, args.compact, cache_dir=cache_dir, hardlink=args.hardlink,
+                     save_counters=args.save_counters)
+  except ValueError as e:
+    sys.stderr.write(f'{str(e)}\n')
+    return 3
 
 
 if __name__ == '__main__': sys.exit(main(sys.argv))
@@ -0,0 +1,933 @@
+'''Executable model of CassBox's cassette handler, for measuring and regression-testing it without DOSBox.
+
+The model runs the machine code in CASSBOX_BIN on a small 8086 interpreter, with INT 13 serviced from a disk image held in
+memory and a sled of HLT instructions standing in for BASIC.  Workloads then call INT 15 the way BASIC does to save and load
+files, and the model counts what that costs: instructions executed, INT 13 calls and sectors, near CALLs by target, and
+executions of every instruction in the handler.
+'''
+
+import argparse
+import functools
+import io
+import json
+import random
+import sys
+
+import cassbox
+
+
+RESIDENT_SEGMENT = 0x9000  # CassBox loads itself here; its listing addresses are offsets in this segment plus 0x100
+LISTING_ORIGIN = 0x100
+RETURN_TRAP = 0x00500  # a HLT that INT 15 calls from the model return to
+CALLER_STACK = (0x0800, 0xFFFE)  # SS:SP for INT 15 calls from the model
+CALLER_BUFFER = (0x2000, 0x0000)  # ES:BX for INT 15 calls from the model
+
+DISK_GEOMETRIES = {  # image size: (sectors per track, heads), as a BIOS (or DOSBox) would infer them from it
+  cassbox.disk_image_size(i): (i.sectors_per_track, i.heads) for i in cassbox.DISK_GEOMETRIES.values()
+}
+
+PARITY = tuple(bin(i).count('1') % 2 == 0 for i in range(256))
+AX, CX, DX, BX, SP, BP, SI, DI = range(8)
+ES, CS, SS, DS = range(4)
+
+
+class EmulationError(Exception):
+  '''The model was asked to run something it doesn't (or can't) emulate.'''
+
+
+class CPU:
+  '''Just enough of an 8086 to run CassBox.'''
+
+  def __init__(self, memory):
+    self.memory = memory
+    self.regs = [0] * 8
+    self.sregs = [0] * 4
+    self.ip = 0
+    self.cf = self.pf = self.af = self.zf = self.sf = self.of = self.df = False
+    self.if_ = True
+    self.halted = False
+    self.interrupt_hooks = {}
+    self.executions = [0] * 0x100000
+    self.instructions = 0
+    self.repetitions = 0
+    self.calls = {}
+    self.loops = 0
+    self._segment = None
+    self._opcodes = [self._unsupported] * 256
+    for op in range(0x40):
+      if op & 7 < 6: self._opcodes[op] = self._alu
+    for op, handler in ((0x06, self._push_sreg), (0x0E, self._push_sreg), (0x16, self._push_sreg), (0x1E, self._push_sreg),
+                        (0x07, self._pop_sreg), (0x17, self._pop_sreg), (0x1F, self._pop_sreg)):
+      self._opcodes[op] = handler
+    for op in range(0x40, 0x48): self._opcodes[op] = self._inc_reg
+    for op in range(0x48, 0x50): self._opcodes[op] = self._dec_reg
+    for op in range(0x50, 0x58): self._opcodes[op] = self._push_reg
+    for op in range(0x58, 0x60): self._opcodes[op] = self._pop_reg
+    for op in range(0x70, 0x80): self._opcodes[op] = self._jcc
+    for op in range(0x80, 0x84): self._opcodes[op] = self._alu_imm
+    for op in (0x84, 0x85): self._opcodes[op] = self._test
+    for op in (0x86, 0x87): self._opcodes[op] = self._xchg
+    for op in range(0x88, 0x8C): self._opcodes[op] = self._mov
+    self._opcodes[0x8C] = self._mov_from_sreg
+    self._opcodes[0x8E] = self._mov_to_sreg
+    self._opcodes[0x8F] = self._pop_rm
+    for op in range(0x90, 0x98): self._opcodes[op] = self._xchg_ax
+    self._opcodes[0x98] = self._cbw
+    self._opcodes[0x99] = self._cwd
+    self._opcodes[0x9C] = self._pushf
+    self._opcodes[0x9D] = self._popf
+    for op in range(0xA0, 0xA4): self._opcodes[op] = self._mov_moffs
+    for op in range(0xA4, 0xA8): self._opcodes[op] = self._string
+    for op in (0xA8, 0xA9): self._opcodes[op] = self._test_acc
+    for op in range(0xAA, 0xB0): self._opcodes[op] = self._string
+    for op in range(0xB0, 0xC0): self._opcodes[op] = self._mov_imm_reg
+    for op in (0xC2, 0xC3): self._opcodes[op] = self._ret
+    for op in (0xC6, 0xC7): self._opcodes[op] = self._mov_imm_rm
+    for op in (0xCA, 0xCB): self._opcodes[op] = self._retf
+    self._opcodes[0xCD] = self._int
+    self._opcodes[0xCF] = self._iret
+    for op in range(0xD0, 0xD4): self._opcodes[op] = self._shift
+    self._opcodes[0xD7] = self._xlat
+    for op in range(0xE0, 0xE4): self._opcodes[op] = self._loop
+    self._opcodes[0xE8] = self._call
+    self._opcodes[0xE9] = self._jmp_near
+    self._opcodes[0xEA] = self._jmp_far
+    self._opcodes[0xEB] = self._jmp_short
+    self._opcodes[0xF4] = self._hlt
+    self._opcodes[0xF5] = self._cmc
+    for op in (0xF6, 0xF7): self._opcodes[op] = self._group3
+    for op in range(0xF8, 0xFE): self._opcodes[op] = self._flag_op
+    for op in (0xFE, 0xFF): self._opcodes[op] = self._group45
+
+  # Running
+
+  def run(self, limit=100000000):
+    '''Run until a HLT instruction is executed, return the number of instructions that took.'''
+    self.halted = False
+    count = 0
+    while not self.halted:
+      self.step()
+      count += 1
+      if count >= limit: raise EmulationError(f'still running after {limit} instructions at {self.sregs[CS]:04X}:{self.ip:04X}')
+    return count
+
+  def step(self):
+    '''Execute one instruction, including any prefixes.'''
+    self.executions[(self.sregs[CS] << 4) + self.ip & 0xFFFFF] += 1
+    self.instructions += 1
+    self._segment = None
+    rep = None
+    while True:
+      op = self.fetch8()
+      if op in (0x26, 0x2E, 0x36, 0x3E):
+        self._segment = (op >> 3) & 3
+      elif op in (0xF2, 0xF3):
+        rep = op
+      else:
+        break
+    if rep is not None:
+      if op not in (0xA4, 0xA5, 0xA6, 0xA7, 0xAA, 0xAB, 0xAC, 0xAD, 0xAE, 0xAF): raise EmulationError(f'REP prefix on {op:02X}')
+      self._rep_string(op, rep)
+    else:
+      self._opcodes[op](op)
+
+  # Memory and registers
+
+  def linear(self, sreg, offset):
+    return ((self.sregs[sreg] << 4) + (offset & 0xFFFF)) & 0xFFFFF
+
+  def read8(self, address):
+    return self.memory[address]
+
+  def read16(self, address):
+    return self.memory[address] | self.memory[(address + 1) & 0xFFFFF] << 8
+
+  def write8(self, address, value):
+    self.memory[address] = value & 0xFF
+
+  def write16(self, address, value):
+    self.memory[address] = value & 0xFF
+    self.memory[(address + 1) & 0xFFFFF] = (value >> 8) & 0xFF
+
+  def fetch8(self):
+    value = self.memory[(self.sregs[CS] << 4) + self.ip & 0xFFFFF]
+    self.ip = (self.ip + 1) & 0xFFFF
+    return value
+
+  def fetch16(self):
+    return self.fetch8() | self.fetch8() << 8
+
+  def fetch_s8(self):
+    value = self.fetch8()
+    return value - 0x100 if value & 0x80 else value
+
+  def get_reg8(self, reg):
+    return self.regs[reg] & 0xFF if reg < 4 else self.regs[reg - 4] >> 8
+
+  def set_reg8(self, reg, value):
+    if reg < 4:
+      self.regs[reg] = (self.regs[reg] & 0xFF00) | (value & 0xFF)
+    else:
+      self.regs[reg - 4] = (self.regs[reg - 4] & 0x00FF) | ((value & 0xFF) << 8)
+
+  def push(self, value):
+    self.regs[SP] = (self.regs[SP] - 2) & 0xFFFF
+    self.write16(self.linear(SS, self.regs[SP]), value)
+
+  def pop(self):
+    value = self.read16(self.linear(SS, self.regs[SP]))
+    self.regs[SP] = (self.regs[SP] + 2) & 0xFFFF
+    return value
+
+  def get_flags(self):
+    return (0xF002 | self.cf | self.pf << 2 | self.af << 4 | self.zf << 6 | self.sf << 7 | self.if_ << 9 | self.df << 10 |
+            self.of << 11)
+
+  def set_flags(self, value):
+    self.cf, self.pf, self.af, self.zf, self.sf, self.if_, self.df, self.of = (bool(value & (1 << i))
+                                                                               for i in (0, 2, 4, 6, 7, 9, 10, 11))
+
+  def _modrm(self):
+    '''Decode a ModRM byte, return the reg field and a location: a linear address, or ~n for register n.'''
+    byte = self.fetch8()
+    mod, reg, rm = byte >> 6, (byte >> 3) & 7, byte & 7
+    if mod == 3: return reg, ~rm
+    regs = self.regs
+    sreg = DS
+    if rm == 0: offset = regs[BX] + regs[SI]
+    elif rm == 1: offset = regs[BX] + regs[DI]
+    elif rm == 2: offset, sreg = regs[BP] + regs[SI], SS
+    elif rm == 3: offset, sreg = regs[BP] + regs[DI], SS
+    elif rm == 4: offset = regs[SI]
+    elif rm == 5: offset = regs[DI]
+    elif rm == 6 and mod == 0: offset = self.fetch16()
+    elif rm == 6: offset, sreg = regs[BP], SS
+    else: offset = regs[BX]
+    if mod == 1: offset += self.fetch_s8()
+    elif mod == 2: offset += self.fetch16()
+    if self._segment is not None: sreg = self._segment
+    return reg, self.linear(sreg, offset)
+
+  def _get(self, location, wide):
+    if location < 0: return self.regs[~location] if wide else self.get_reg8(~location)
+    return self.read16(location) if wide else self.memory[location]
+
+  def _set(self, location, wide, value):
+    if location < 0:
+      if wide: self.regs[~location] = value & 0xFFFF
+      else: self.set_reg8(~location, value)
+    elif wide:
+      self.write16(location, value)
+    else:
+      self.memory[location] = value & 0xFF
+
+  # Arithmetic
+
+  def _szp(self, value, wide):
+    self.zf = value == 0
+    self.sf = bool(value & (0x8000 if wide else 0x80))
+    self.pf = PARITY[value & 0xFF]
+
+  def _arith(self, operation, a, b, wide):
+    '''Perform ALU operation n (ADD, OR, ADC, SBB, AND, SUB, XOR, CMP) on a and b, set flags, return the result.'''
+    mask, sign = (0xFFFF, 0x8000) if wide else (0xFF, 0x80)
+    if operation in (0, 2):
+      result = a + b + (self.cf if operation == 2 else 0)
+      self.cf = result > mask
+      result &= mask
+      self.of = bool((a ^ result) & (b ^ result) & sign)
+      self.af = bool((a ^ b ^ result) & 0x10)
+    elif operation in (3, 5, 7):
+      result = a - b - (self.cf if operation == 3 else 0)
+      self.cf = result < 0
+      result &= mask
+      self.of = bool((a ^ b) & (a ^ result) & sign)
+      self.af = bool((a ^ b ^ result) & 0x10)
+    else:
+      result = (a | b) if operation == 1 else (a & b) if operation == 4 else (a ^ b)
+      self.cf = self.of = False
+    self._szp(result, wide)
+    return result
+
+  def _alu(self, op):
+    operation, form = op >> 3, op & 7
+    wide = bool(op & 1)
+    if form < 4:
+      reg, location = self._modrm()
+      reg = ~reg
+      if form & 2: reg, location = location, reg
+      result = self._arith(operation, self._get(location, wide), self._get(reg, wide), wide)
+      if operation != 7: self._set(location, wide, result)
+    else:
+      b = self.fetch16() if wide else self.fetch8()
+      result = self._arith(operation, self._get(~AX, wide), b, wide)
+      if operation != 7: self._set(~AX, wide, result)
+
+  def _alu_imm(self, op):
+    operation, location = self._modrm()
+    wide = op & 1
+    if op == 0x81: b = self.fetch16()
+    elif op == 0x83: b = self.fetch_s8() & 0xFFFF
+    else: b = self.fetch8()
+    result = self._arith(operation, self._get(location, wide), b, wide)
+    if operation != 7: self._set(location, wide, result)
+
+  def _test(self, op):
+    reg, location = self._modrm()
+    wide = op & 1
+    self._arith(4, self._get(location, wide), self._get(~reg, wide), wide)
+
+  def _test_acc(self, op):
+    wide = op & 1
+    self._arith(4, self._get(~AX, wide), self.fetch16() if wide else self.fetch8(), wide)
+
+  def _incdec(self, value, wide, delta):
+    cf = self.cf
+    result = self._arith(0 if delta > 0 else 5, value, 1, wide)
+    self.cf = cf
+    return result
+
+  def _inc_reg(self, op):
+    self.regs[op & 7] = self._incdec(self.regs[op & 7], True, 1)
+
+  def _dec_reg(self, op):
+    self.regs[op & 7] = self._incdec(self.regs[op & 7], True, -1)
+
+  def _shift(self, op):
+    operation, location = self._modrm()
+    wide = op & 1
+    bits, mask = (16, 0xFFFF) if wide else (8, 0xFF)
+    count = self.get_reg8(CX) if op & 2 else 1
+    if not count: return
+    value = original = self._get(location, wide)
+    cf = self.cf
+    for _ in range(count):
+      if operation == 0: cf = value >> (bits - 1); value = ((value << 1) | cf) & mask
+      elif operation == 1: cf = value & 1; value = (value >> 1) | (cf << (bits - 1))
+      elif operation == 2: value, cf = ((value << 1) | cf) & mask, value >> (bits - 1)
+      elif operation == 3: value, cf = (value >> 1) | (cf << (bits - 1)), value & 1
+      elif operation in (4, 6): cf = value >> (bits - 1); value = (value << 1) & mask
+      elif operation == 5: cf = value & 1; value >>= 1
+      else: cf = value & 1; value = (value >> 1) | (value & (1 << (bits - 1)))
+    self.cf = bool(cf)
+    msb = value >> (bits - 1)
+    if operation in (0, 2, 4, 6): self.of = bool(msb ^ cf)
+    elif operation in (1, 3): self.of = bool(msb ^ ((value >> (bits - 2)) & 1))
+    elif operation == 5: self.of = bool(original >> (bits - 1))
+    else: self.of = False
+    if operation >= 4: self._szp(value, wide)
+    self._set(location, wide, value)
+
+  def _group3(self, op):
+    operation, location = self._modrm()
+    wide = op & 1
+    value = self._get(location, wide)
+    if operation == 0:
+      self._arith(4, value, self.fetch16() if wide else self.fetch8(), wide)
+    elif operation == 2:
+      self._set(location, wide, ~value)
+    elif operation == 3:
+      self._set(location, wide, self._arith(5, 0, value, wide))
+    elif operation == 4:
+      if wide:
+        result = self.regs[AX] * value
+        self.regs[AX], self.regs[DX] = result & 0xFFFF, result >> 16
+      else:
+        result = (self.regs[AX] & 0xFF) * value
+        self.regs[AX] = result
+      self.cf = self.of = result > (0xFFFF if wide else 0xFF)
+    elif operation == 6:
+      dividend = (self.regs[DX] << 16 | self.regs[AX]) if wide else self.regs[AX]
+      if not value or dividend // value > (0xFFFF if wide else 0xFF): raise EmulationError('divide error')
+      if wide: self.regs[AX], self.regs[DX] = divmod(dividend, value)
+      else: self.regs[AX] = (dividend // value) | (dividend % value) << 8
+    else:
+      raise EmulationError(f'unsupported instruction {op:02X} /{operation}')
+
+  def _group45(self, op):
+    operation, location = self._modrm()
+    if op == 0xFE and operation > 1: raise EmulationError(f'unsupported instruction FE /{operation}')
+    if operation < 2:
+      self._set(location, op & 1, self._incdec(self._get(location, op & 1), op & 1, -1 if operation else 1))
+    elif operation == 2:
+      target = self._get(location, True)
+      self.calls[target] = self.calls.get(target, 0) + 1
+      self.push(self.ip)
+      self.ip = target
+    elif operation == 4:
+      self.ip = self._get(location, True)
+    elif operation == 6:
+      self.push(self._get(location, True))
+    else:
+      raise EmulationError(f'unsupported instruction FF /{operation}')
+
+  # Data movement
+
+  def _mov(self, op):
+    reg, location = self._modrm()
+    wide = op & 1
+    if op & 2: self._set(~reg, wide, self._get(location, wide))
+    else: self._set(location, wide, self._get(~reg, wide))
+
+  def _mov_from_sreg(self, op):
+    reg, location = self._modrm()
+    self._set(location, True, self.sregs[reg & 3])
+
+  def _mov_to_sreg(self, op):
+    reg, location = self._modrm()
+    self.sregs[reg & 3] = self._get(location, True)
+
+  def _mov_moffs(self, op):
+    address = self.linear(DS if self._segment is None else self._segment, self.fetch16())
+    wide = op & 1
+    if op & 2: self._set(address, wide, self._get(~AX, wide))
+    else: self._set(~AX, wide, self._get(address, wide))
+
+  def _mov_imm_reg(self, op):
+    if op & 8: self.regs[op & 7] = self.fetch16()
+    else: self.set_reg8(op & 7, self.fetch8())
+
+  def _mov_imm_rm(self, op):
+    _, location = self._modrm()
+    wide = op & 1
+    self._set(location, wide, self.fetch16() if wide else self.fetch8())
+
+  def _xchg(self, op):
+    reg, location = self._modrm()
+    wide = op & 1
+    a, b = self._get(location, wide), self._get(~reg, wide)
+    self._set(location, wide, b)
+    self._set(~reg, wide, a)
+
+  def _xchg_ax(self, op):
+    self.regs[AX], self.regs[op & 7] = self.regs[op & 7], self.regs[AX]
+
+  def _cbw(self, op):
+    self.regs[AX] = (self.regs[AX] & 0xFF) | (0xFF00 if self.regs[AX] & 0x80 else 0)
+
+  def _cwd(self, op):
+    self.regs[DX] = 0xFFFF if self.regs[AX] & 0x8000 else 0
+
+  def _xlat(self, op):
+    sreg = DS if self._segment is None else self._segment
+    self.set_reg8(AX, self.memory[self.linear(sreg, self.regs[BX] + (self.regs[AX] & 0xFF))])
+
+  def _push_reg(self, op):
+    self.push(self.regs[op & 7])
+
+  def _pop_reg(self, op):
+    self.regs[op & 7] = self.pop()
+
+  def _push_sreg(self, op):
+    self.push(self.sregs[op >> 3])
+
+  def _pop_sreg(self, op):
+    self.sregs[op >> 3] = self.pop()
+
+  def _pop_rm(self, op):
+    _, location = self._modrm()
+    self._set(location, True, self.pop())
+
+  def _pushf(self, op):
+    self.push(self.get_flags())
+
+  def _popf(self, op):
+    self.set_flags(self.pop())
+
+  # String instructions
+
+  def _string(self, op):
+    wide = op & 1
+    size = 2 if wide else 1
+    step = -size if self.df else size
+    source = self.linear(DS if self._segment is None else self._segment, self.regs[SI])
+    destination = self.linear(ES, self.regs[DI])
+    if op in (0xA4, 0xA5):
+      self._set(destination, wide, self._get(source, wide))
+    elif op in (0xA6, 0xA7):
+      self._arith(7, self._get(source, wide), self._get(destination, wide), wide)
+    elif op in (0xAA, 0xAB):
+      self._set(destination, wide, self._get(~AX, wide))
+    elif op in (0xAC, 0xAD):
+      self._set(~AX, wide, self._get(source, wide))
+    else:
+      self._arith(7, self._get(~AX, wide), self._get(destination, wide), wide)
+    if op in (0xA4, 0xA5, 0xA6, 0xA7, 0xAC, 0xAD): self.regs[SI] = (self.regs[SI] + step) & 0xFFFF
+    if op not in (0xAC, 0xAD): self.regs[DI] = (self.regs[DI] + step) & 0xFFFF
+
+  def _rep_string(self, op, rep):
+    compares = op in (0xA6, 0xA7, 0xAE, 0xAF)
+    while self.regs[CX]:
+      self._string(op)
+      self.regs[CX] = (self.regs[CX] - 1) & 0xFFFF
+      self.repetitions += 1
+      if compares and self.zf != (rep == 0xF3): break
+
+  # Control flow
+
+  def _jcc(self, op):
+    displacement = self.fetch_s8()
+    condition = op >> 1 & 7
+    if condition == 0: taken = self.of
+    elif condition == 1: taken = self.cf
+    elif condition == 2: taken = self.zf
+    elif condition == 3: taken = self.cf or self.zf
+    elif condition == 4: taken = self.sf
+    elif condition == 5: taken = self.pf
+    elif condition == 6: taken = self.sf != self.of
+    else: taken = self.zf or self.sf != self.of
+    if taken != bool(op & 1): self.ip = (self.ip + displacement) & 0xFFFF
+
+  def _loop(self, op):
+    displacement = self.fetch_s8()
+    if op == 0xE3:
+      taken = self.regs[CX] == 0
+    else:
+      self.loops += 1
+      self.regs[CX] = (self.regs[CX] - 1) & 0xFFFF
+      taken = self.regs[CX] != 0 and (op == 0xE2 or self.zf == (op == 0xE1))
+    if taken: self.ip = (self.ip + displacement) & 0xFFFF
+
+  def _call(self, op):
+    displacement = self.fetch16()
+    target = (self.ip + displacement) & 0xFFFF
+    self.calls[target] = self.calls.get(target, 0) + 1
+    self.push(self.ip)
+    self.ip = target
+
+  def _jmp_near(self, op):
+    displacement = self.fetch16()
+    self.ip = (self.ip + displacement) & 0xFFFF
+
+  def _jmp_short(self, op):
+    displacement = self.fetch_s8()
+    self.ip = (self.ip + displacement) & 0xFFFF
+
+  def _jmp_far(self, op):
+    ip = self.fetch16()
+    self.sregs[CS] = self.fetch16()
+    self.ip = ip
+
+  def _ret(self, op):
+    release = self.fetch16() if op == 0xC2 else 0
+    self.ip = self.pop()
+    self.regs[SP] = (self.regs[SP] + release) & 0xFFFF
+
+  def _retf(self, op):
+    release = self.fetch16() if op == 0xCA else 0
+    self.ip = self.pop()
+    self.sregs[CS] = self.pop()
+    self.regs[SP] = (self.regs[SP] + release) & 0xFFFF
+
+  def interrupt(self, vector):
+    '''Raise a software interrupt, either handled by a Python hook or through the interrupt vector table.'''
+    if vector in self.interrupt_hooks:
+      self.interrupt_hooks[vector](self)
+      return
+    target = self.read16(vector * 4), self.read16(vector * 4 + 2)
+    if target == (0, 0): raise EmulationError(f'no handler for INT {vector:02X}')
+    self.push(self.get_flags())
+    self.if_ = False
+    self.push(self.sregs[CS])
+    self.push(self.ip)
+    self.ip, self.sregs[CS] = target
+
+  def _int(self, op):
+    self.interrupt(self.fetch8())
+
+  def _iret(self, op):
+    self.ip = self.pop()
+    self.sregs[CS] = self.pop()
+    self.set_flags(self.pop())
+
+  def _hlt(self, op):
+    self.halted = True
+
+  def _cmc(self, op):
+    self.cf = not self.cf
+
+  def _flag_op(self, op):
+    if op == 0xF8: self.cf = False
+    elif op == 0xF9: self.cf = True
+    elif op == 0xFA: self.if_ = False
+    elif op == 0xFB: self.if_ = True
+    elif op == 0xFC: self.df = False
+    else: self.df = True
+
+  def _unsupported(self, op):
+    raise EmulationError(f'unsupported opcode {op:02X} at {self.sregs[CS]:04X}:{(self.ip - 1) & 0xFFFF:04X}')
+
+
+class Machine:
+  '''A PC booted from a CassBox diskette image, with the model standing in for BIOS disk services and for BASIC.'''
+
+  def __init__(self, image):
+    if len(image) not in DISK_GEOMETRIES: raise ValueError(f'no known diskette geometry is {len(image)} bytes in size')
+    self.disk = bytearray(image)
+    self.sectors_per_track, self.heads = DISK_GEOMETRIES[len(image)]
+    self.cpu = CPU(bytearray(0x100000))
+    self.cpu.interrupt_hooks[0x13] = self._int13
+    self.cpu.memory[RETURN_TRAP] = 0xF4
+    self.reset_counters()
+    self.boot()
+
+  def reset_counters(self):
+    '''Zero all the counters.'''
+    cpu = self.cpu
+    cpu.executions = [0] * 0x100000
+    cpu.instructions = cpu.repetitions = cpu.loops = 0
+    cpu.calls = {}
+    self.disk_reads = self.disk_writes = self.sectors_read = self.sectors_written = self.track_crossings = 0
+
+  def counters(self):
+    '''Return the counters accumulated since they were last reset.'''
+    return {
+      'cycles': self.cpu.instructions + self.cpu.repetitions,
+      'int13_reads': self.disk_reads,
+      'sectors_read': self.sectors_read,
+      'int13_writes': self.disk_writes,
+      'sectors_written': self.sectors_written,
+      'track_crossings': self.track_crossings,
+      'calls': sum(self.cpu.calls.values()),
+      'loop_iterations': self.cpu.loops,
+    }
+
+  def boot(self):
+    '''Load the boot sector and run it until it jumps into BASIC (which in the model is a sled of HLTs).'''
+    cpu = self.cpu
+    cpu.memory[0x7C00:0x7E00] = self.disk[:512]
+    cpu.sregs[CS] = cpu.sregs[DS] = cpu.sregs[ES] = cpu.sregs[SS] = 0
+    cpu.regs[SP] = 0x7C00
+    cpu.regs[DX] = 0
+    cpu.ip = 0x7C00
+    cpu.run()
+
+  def _int13(self, cpu):
+    '''Service an INT 13 call from the disk image, permitting reads and writes that cross track boundaries like DOSBox.'''
+    function = cpu.regs[AX] >> 8
+    count = cpu.regs[AX] & 0xFF
+    if function == 0:
+      cpu.regs[AX] &= 0x00FF
+      cpu.cf = False
+      return
+    if function not in (2, 3): raise EmulationError(f'unsupported INT 13 function {function:02X}')
+    cx, dx = cpu.regs[CX], cpu.regs[DX]
+    cylinder, sector, head = (cx >> 8) | (cx & 0xC0) << 2, cx & 0x3F, dx >> 8
+    block = (cylinder * self.heads + head) * self.sectors_per_track + sector - 1
+    if dx & 0xFF or not 1 <= sector <= self.sectors_per_track or head >= self.heads or not count or \
+       (block + count) * 512 > len(self.disk):
+      cpu.regs[AX] = 0x0400  # sector not found
+      cpu.cf = True
+      return
+    if (block % self.sectors_per_track) + count > self.sectors_per_track: self.track_crossings += 1
+    address = cpu.linear(ES, cpu.regs[BX])
+    size = count * 512
+    if function == 2:
+      cpu.memory[address:address + size] = self.disk[block * 512:block * 512 + size]
+      self.disk_reads += 1
+      self.sectors_read += count
+    else:
+      self.disk[block * 512:block * 512 + size] = cpu.memory[address:address + size]
+      self.disk_writes += 1
+      self.sectors_written += count
+    cpu.regs[AX] = count
+    cpu.cf = False
+
+  def int15(self, function, length=0, data=b''):
+    '''Call INT 15 the way BASIC does, return AH, carry, DX, and the contents of the caller's buffer.'''
+    cpu = self.cpu
+    buffer = (CALLER_BUFFER[0] << 4) + CALLER_BUFFER[1]
+    cpu.memory[buffer:buffer + len(data)] = data
+    cpu.sregs[SS], cpu.regs[SP] = CALLER_STACK
+    cpu.sregs[ES], cpu.regs[BX] = CALLER_BUFFER
+    cpu.regs[AX] = function << 8
+    cpu.regs[CX] = length
+    cpu.sregs[CS], cpu.ip = RETURN_TRAP >> 4, RETURN_TRAP & 0xF
+    cpu.interrupt(0x15)
+    cpu.run()
+    if (cpu.sregs[CS] << 4) + cpu.ip - 1 != RETURN_TRAP: raise EmulationError('INT 15 did not return to its caller')
+    return cpu.regs[AX] >> 8, cpu.cf, cpu.regs[DX], bytes(cpu.memory[buffer:buffer + length])
+
+  def peek_position(self):
+    '''Return the tape position (block number, offset in block) that the handler keeps in memory.'''
+    base = RESIDENT_SEGMENT << 4
+    return self.cpu.read16(base + 2), self.cpu.read16(base)
+
+  def peek_handler_counters(self):
+    '''Return the counters that the handler keeps in memory.'''
+    address = (RESIDENT_SEGMENT << 4) + cassbox.TAPE_DIRECTORY_ADDRESS + cassbox.TAPE_DIRECTORY_COUNTERS
+    return cassbox.HandlerCounters._make(cassbox.HANDLER_COUNTERS.unpack_from(self.cpu.memory, address))
+
+  def poke_position(self, block, offset=0):
+    '''Wind or rewind the tape the way the README says to from BASIC.'''
+    base = RESIDENT_SEGMENT << 4
+    self.cpu.write16(base, offset)
+    self.cpu.write16(base + 2, block)
+
+  def poke_tape(self, tape):
+    '''Switch tapes in a tape library the way the README says to from BASIC.'''
+    self.cpu.write8((RESIDENT_SEGMENT << 4) + 0x0D, tape)
+
+
+# Workloads: what BASIC does with INT 15 to save and load files
+
+def _check(result, what):
+  status, carry, _, _ = result
+  if carry: raise EmulationError(f'{what} failed with status {status:02X}')
+  return result
+
+
+def save_file(machine, name, file_type, data, segment=0, offset=0):
+  '''Save a file the way BASIC does: a header record, then the data as one record, or one record per block for A and D.'''
+  length = 0 if file_type in ('A', 'D') else len(data)
+  header = cassbox.make_basic_header(name, file_type, length, segment, offset)
+  _check(machine.int15(3, cassbox.CASSETTE_BLOCK_SIZE, header), 'write')
+  if file_type in ('A', 'D'):
+    size = cassbox.BASIC_RECORD_DATA_SIZE
+    chunks = [data[i:i + size] for i in range(0, len(data), size)] or [b'']
+    if len(chunks[-1]) == size: chunks.append(b'')
+    for chunk in chunks[:-1]: _check(machine.int15(3, cassbox.CASSETTE_BLOCK_SIZE, b'\x00' + chunk), 'write')
+    last = (bytes((len(chunks[-1]) + 1,)) + chunks[-1]).ljust(cassbox.CASSETTE_BLOCK_SIZE, b'\x00')
+    _check(machine.int15(3, cassbox.CASSETTE_BLOCK_SIZE, last), 'write')
+  else:
+    _check(machine.int15(3, len(data), data), 'write')
+
+
+def load_file(machine, name):
+  '''Load a file the way BASIC does, reading records from the current position until its header turns up.'''
+  while True:
+    status, carry, _, header = machine.int15(2, cassbox.CASSETTE_BLOCK_SIZE)
+    if carry and status != 1: return None  # run off the end of the tape
+    if carry or header[0] != cassbox.BASIC_HEADER_SIGNATURE: continue
+    if header[1:9].decode('latin-1').rstrip(' ') == name: break
+  file_type = cassbox.BASIC_FILE_TYPES.get(header[9], '?')
+  if file_type in ('A', 'D'):
+    chunks = []
+    while True:
+      _, _, _, block = _check(machine.int15(2, cassbox.CASSETTE_BLOCK_SIZE), 'read')
+      if block[0]:
+        chunks.append(block[1:block[0]])
+        return b''.join(chunks)
+      chunks.append(block[1:])
+  length = int.from_bytes(header[10:12], 'little')
+  _, _, _, data = _check(machine.int15(2, length), 'read')
+  return data
+
+
+def seek_file(machine, name):
+  '''Seek to a file using the tape directory, return whether it was found there.'''
+  _, carry, _, _ = machine.int15(4, 0, name.ljust(8).encode('latin-1'))
+  return not carry
+
+
+def build_image(cassette_data=b'', compact=False, geometry=cassbox.DISK_GEOMETRIES[cassbox.DEFAULT_GEOMETRY]):
+  '''Build a diskette image with a HLT sled in place of the BASIC ROM, a tape directory, and the given cassette data.'''
+  basic_rom = b'\xF4' * (cassbox.BASIC_ROM_SIZE * cassbox.BASIC_ROM_NUMBER_OF_CHIPS)
+  return b''.join((cassbox.make_cassbox_bin(geometry), basic_rom, cassbox.make_tape_directory(cassette_data, compact),
+                   cassette_data.ljust(cassbox.cassette_size(geometry), b'\x00')))
+
+
+# Benchmark corpus
+
+BENCHMARK_CORPUS = (  # tape name, files on it (name, type, length, segment, offset), names of files to load back
+  ('hello', (('HELLO', 'B', 350, 0, 0),), ('HELLO',)),
+  ('game', (('ADVENT', 'B', 14000, 0, 0), ('TITLE', 'M', 16000, 0xB800, 0)), ('ADVENT', 'TITLE')),
+  ('compilation', tuple((f'PROG{i:02}', 'B', 500 + i * 223 % 5500, 0, 0) for i in range(24)), ('PROG00', 'PROG12', 'PROG23')),
+  ('ledger', (('LEDGER', 'B', 2100, 0, 0), ('ACCOUNTS', 'D', 5000, 0, 0)), ('ACCOUNTS',)),
+  ('bigbin', (('PATCH', 'M', 40000, 0x2000, 0),), ('PATCH',)),
+)
+
+
+def benchmark_file_data(tape, name, file_type, length):
+  '''Return reproducible contents for a benchmark file, resembling what would really be in one of its type.'''
+  rng = random.Random(f'{tape}/{name}')
+  if file_type == 'M' and length <= 16384:  # text screen: mostly spaces with an attribute byte between
+    return bytes(rng.choice(b'      ABCDEFGHIJKLMNOPQRSTUVWXYZ*#') if i % 2 == 0 else 0x07 for i in range(length))
+  if file_type in ('A', 'D'):
+    return bytes(rng.choice(b' 0123456789,."ABCDEFGHIJKLMNOPQRSTUVWXYZ\r\n') for _ in range(length))
+  return bytes(rng.randrange(256) for _ in range(length))
+
+
+def run_benchmark(tape, files, loads, compact=False, geometry=cassbox.DISK_GEOMETRIES[cassbox.DEFAULT_GEOMETRY]):
+  '''Save a tape's files through the handler onto a blank image, then load some back, first by rewinding and scanning the
+  tape and then (from an image built with a tape directory) by seeking to them, return per-phase counters.
+  '''
+  contents = {name: benchmark_file_data(tape, name, file_type, length) for name, file_type, length, _, _ in files}
+  results = {}
+  machine = Machine(build_image(compact=compact, geometry=geometry))
+  results['boot'] = machine.counters()
+  machine.reset_counters()
+  for name, file_type, _, segment, offset in files: save_file(machine, name, file_type, contents[name], segment, offset)
+  results['save'] = machine.counters()
+  machine.reset_counters()
+  for name in loads:
+    machine.poke_position(0)
+    if load_file(machine, name) != contents[name]: raise EmulationError(f'{name} on tape {tape} did not load back intact')
+  results['load'] = machine.counters()
+  seek_machine = Machine(build_image(bytes(machine.disk[-cassbox.cassette_size(geometry):]), compact, geometry))
+  seek_machine.reset_counters()
+  for name in loads:
+    if not seek_file(seek_machine, name): raise EmulationError(f'{name} on tape {tape} is not in the tape directory')
+    if load_file(seek_machine, name) != contents[name]: raise EmulationError(f'{name} on tape {tape} did not load back intact')
+  results['seek'] = seek_machine.counters()
+  check_handler_counters(machine, results['save'], results['load'])
+  check_handler_counters(seek_machine, results['seek'])
+  return results, machine
+
+
+LIBRARY_CORPUS = (('FIRST', 'B', 3000, 0, 0), ('SECOND', 'B', 3000, 0, 0))  # one file per tape
+
+
+def run_library_benchmark(compact=False, geometry=cassbox.DISK_GEOMETRIES[cassbox.DEFAULT_GEOMETRY]):
+  '''Build a two-tape library, switch to the first tape, and save across the end of it, making sure the save stops at the end
+  of the tape rather than running into the second one, then switch to the second tape and load its file, return per-phase
+  counters.
+  '''
+  contents = {name: benchmark_file_data('library', name, file_type, length) for name, file_type, length, _, _ in LIBRARY_CORPUS}
+  cassettes = [io.BytesIO(b''.join(cassbox.make_cassette_data([cassbox.BasicFile(name, file_type, contents[name], segment,
+                                                                                 offset)])))
+               for name, file_type, _, segment, offset in LIBRARY_CORPUS]
+  basic_rom = b'\xF4' * (cassbox.BASIC_ROM_SIZE * cassbox.BASIC_ROM_NUMBER_OF_CHIPS)
+  image = cassbox.build_image(basic_rom, cassettes, geometry=geometry, compact=compact)
+  (_, first_blocks), (second_block, _) = cassbox.read_tape_library(image)
+  second_directory = cassbox.CASSETTE_POSITION + second_block * cassbox.TAPE_DIRECTORY_SIZE
+  second_directory = slice(second_directory, second_directory + cassbox.TAPE_DIRECTORY_SIZE)
+  results = {}
+  machine = Machine(image)
+  results['boot'] = machine.counters()
+  machine.reset_counters()
+  machine.poke_tape(1)
+  _check(machine.int15(0), 'motor on')  # the switch happens (and rewinds) on the next cassette operation
+  machine.poke_position(first_blocks - 1)
+  _, carry, _, _ = machine.int15(3, 2 * cassbox.CASSETTE_BLOCK_SIZE, contents['FIRST'])
+  if not carry: raise EmulationError('saving across the end of tape 1 did not fail')
+  if machine.disk[second_directory] != image[second_directory]: raise EmulationError('saving ran off tape 1 into tape 2')
+  results['save'] = machine.counters()
+  machine.reset_counters()
+  machine.poke_tape(2)
+  if load_file(machine, 'SECOND') != contents['SECOND']: raise EmulationError('SECOND on tape 2 did not load back intact')
+  results['load'] = machine.counters()
+  check_handler_counters(machine, results['save'], results['load'])
+  return results, machine
+
+
+def check_handler_counters(machine, *phases):
+  '''Make sure the handler counted the disk traffic the model saw it make in the given phases since booting.'''
+  counters = machine.peek_handler_counters()
+  for name in ('int13_reads', 'sectors_read', 'int13_writes', 'sectors_written'):
+    seen = sum(phase[name] for phase in phases)
+    if getattr(counters, name) != seen: raise EmulationError(f'handler counted {getattr(counters, name)} {name}, model saw {seen}')
+
+
+def listing_line(address):
+  '''Return the CASSBOX_ASM line for a linear address in CassBox's resident code, or None if there isn't one.'''
+  listing_address = address - (RESIDENT_SEGMENT << 4) + LISTING_ORIGIN
+  for line in cassbox.CASSBOX_ASM:
+    if int(line[:4], 16) == listing_address: return line.rstrip()
+  return None
+
+
+def hot_spots(machine, count):
+  '''Return the most executed instructions in the handler as (executions, listing line) tuples.'''
+  executions = machine.cpu.executions
+  base = RESIDENT_SEGMENT << 4
+  spots = sorted(((executions[i], i) for i in range(base, base + len(cassbox.CASSBOX_BIN)) if executions[i]), reverse=True)
+  return [(n, listing_line(i) or f'{i:05X}') for n, i in spots[:count]]
+
+
+COLUMNS = ('cycles', 'int13_reads', 'sectors_read', 'int13_writes', 'sectors_written', 'calls', 'loop_iterations')
+
+
+def _format_table(results, baseline=None):
+  lines = [f'{"tape":12} {"phase":5} ' + ' '.join(f'{i:>15}' for i in COLUMNS)]
+  for tape, phases in results.items():
+    for phase, counters in phases.items():
+      cells = []
+      for column in COLUMNS:
+        cell = str(counters[column])
+        old = (baseline or {}).get(tape, {}).get(phase, {}).get(column)
+        if old: cell = f'{cell} ({(counters[column] - old) * 100 / old:+.0f}%)'
+        cells.append(f'{cell:>15}')
+      lines.append(f'{tape:12} {phase:5} ' + ' '.join(cells))
+  return '\n'.join(lines)
+
+
+def main_bench(args):
+  results = {}
+  runs = [(tape, functools.partial(run_benchmark, tape, files, loads)) for tape, files, loads in BENCHMARK_CORPUS]
+  runs.append(('library', run_library_benchmark))
+  for tape, run in runs:
+    if args.tapes and tape not in args.tapes: continue
+    try:
+      results[tape], machine = run(args.compact, cassbox.DISK_GEOMETRIES[args.geometry])
+    except EmulationError as e:
+      sys.stderr.write(f'{str(e)}\n')
+      return 1
+    if args.profile:
+      sys.stdout.write(f'{tape} (load):\n')
+      for executions, line in hot_spots(machine, args.profile): sys.stdout.write(f'{executions:12} {line}\n')
+  baseline = None
+  if args.compare:
+    with open(args.compare, 'r') as fp:
+      baseline = json.load(fp)
+  sys.stdout.write(f'{_format_table(results, baseline)}\n')
+  if args.save:
+    with open(args.save, 'w') as fp:
+      json.dump(results, fp, indent=2)
+  return 0
+
+
+def main_run(args):
+  geometry = cassbox.DISK_GEOMETRIES[args.geometry]
+  try:
+    cassette_data = cassbox.read_cassette_file(args.cassette, args.compact, cassbox.cassette_size(geometry))
+  except (OSError, ValueError) as e:
+    sys.stderr.write(f'{str(e)}\n')
+    return 3
+  names = args.names or [i.name for i in cassbox.read_cassette_files(cassette_data, args.compact)]
+  machine = Machine(build_image(cassette_data, args.compact, geometry))
+  machine.reset_counters()
+  result = 0
+  for name in names:
+    machine.poke_position(0)
+    try:
+      if args.seek and not seek_file(machine, name):
+        sys.stderr.write(f"{name} isn't in the tape directory\n")
+        result = 1
+        continue
+      if load_file(machine, name) is None:
+        sys.stderr.write(f"couldn't find {name} on the cassette\n")
+        result = 1
+    except EmulationError as e:
+      sys.stderr.write(f'{str(e)}\n')
+      return 1
+  sys.stdout.write(f'{_format_table({args.cassette: {"load": machine.counters()}})}\n')
+  if args.profile:
+    for executions, line in hot_spots(machine, args.profile): sys.stdout.write(f'{executions:12} {line}\n')
+  return result
+
+
+def main(argv):
+  parser = argparse.ArgumentParser(description="Measure the cost of CassBox's cassette handler on an executable model.")
+  commands = parser.add_subparsers(dest='command', required=True)
+  bench = commands.add_parser('bench', help='save and load the benchmark corpus, reporting costs per tape')
+  bench.add_argument('tapes', metavar='TAPE', nargs='*', help='benchmark tapes to run (default: all)')
+  bench.add_argument('--save', metavar='FILENAME.JSON', help='save results for later comparison')
+  bench.add_argument('--compare', metavar='FILENAME.JSON', help='show changes relative to saved results')
+  bench.add_argument('--geometry', choices=cassbox.DISK_GEOMETRIES, default=cassbox.DEFAULT_GEOMETRY,
+                     help='size of diskette image to use (default: %(default)s)')
+  bench.add_argument('--compact', action='store_true', help='use images with compacted leaders')
+  bench.add_argument('--profile', metavar='N', type=int, default=0, help='show the N most executed handler instructions')
+  run = commands.add_parser('run', help='load files from a cassette file, reporting costs')
+  run.add_argument('cassette', metavar='FILENAME.CAS', help='cassette file to load from')
+  run.add_argument('names', metavar='NAME', nargs='*', help='files to load (default: every file found on the cassette)')
+  run.add_argument('--geometry', choices=cassbox.DISK_GEOMETRIES, default=cassbox.DEFAULT_GEOMETRY,
+                   help='size of diskette image to use (default: %(default)s)')
+  run.add_argument('--compact', action='store_true', help='compact the cassette file\'s leaders when building the image')
+  run.add_argument('--seek', action='store_true', help='seek to each file using the tape directory instead of scanning for it')
+  run.add_argument('--profile', metavar='N', type=int, default=0, help='show the N most executed handler instructions')
+  args = parser.parse_args(argv[1:])
+  return main_bench(args) if args.command == 'bench' else main_run(args)
+
+
+if __name__ == '__main__': sys.exit(main(sys.argv))